@@ -1,11 +1,14 @@
 import asyncio
 import datetime
 import discord
+import heapq
 import logging
 import pytz
+import time
 
 from difflib import get_close_matches
 from discord.ext import commands
+from pymongo import UpdateOne
 from pytz import timezone
 
 from core import checks
@@ -13,6 +16,16 @@ from core.models import PermissionLevel
 
 logger = logging.getLogger("Modmail")
 
+# Days missed while the bot was offline that are still announced late
+MAX_CATCH_UP_DAYS = 7
+# How long members keep the birthday role
+ROLE_DURATION = 24 * 60 * 60
+# Role removals run on a few workers, each pausing between requests to stay clear of rate limits
+REMOVAL_WORKERS = 2
+REMOVAL_INTERVAL = 1.0
+# Delay before a removal that could not be done is tried again
+REMOVAL_RETRY = 60 * 60
+
 
 class BirthdayPlugin(commands.Cog):
     """
@@ -22,25 +35,31 @@ class BirthdayPlugin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = bot.plugin_db.get_partition(self)
-        self.birthdays = dict()
         self.roles = dict()
         self.channels = dict()
+        # Default timezone and per guild overrides
         self.timezone = "America/Chicago"
+        self.timezones = dict()
+        # Guild id -> the last date its birthdays were processed for
+        self.processed = dict()
+        self.schedule_changed = asyncio.Event()
         self.messages = dict()
         self.enabled = True
-        self.booted = True
-        self.bot.loop.create_task(self._set_db())
+        # Pending role removals, "expiry-<guild>-<user>" -> timestamp, with a heap ordered by that timestamp
+        self.expiries = dict()
+        self.expiry_schedule = []
+        self.expiry_changed = asyncio.Event()
+        self.removals = asyncio.Queue()
+        self.tasks = [self.bot.loop.create_task(self._set_db())]
+        self.tasks.extend(self.bot.loop.create_task(self._run_removals()) for _ in range(REMOVAL_WORKERS))
+
+    async def cog_unload(self):
+        for task in self.tasks:
+            task.cancel()
 
     async def _set_db(self):
-        birthdays = await self.db.find_one({"_id": "birthdays"})
         config = await self.db.find_one({"_id": "config"})
 
-        if birthdays is None:
-            await self.db.find_one_and_update(
-                {"_id": "birthdays"}, {"$set": {"birthdays": dict()}}, upsert=True
-            )
-            birthdays = await self.db.find_one({"_id": "birthdays"})
-
         if config is None:
             await self.db.find_one_and_update(
                 {"_id": "config"},
@@ -57,18 +76,43 @@ class BirthdayPlugin(commands.Cog):
             )
             config = await self.db.find_one({"_id": "config"})
 
-        self.birthdays = birthdays.get("birthdays", dict())
         self.roles = config.get("roles", dict())
         self.channels = config.get("channels", dict())
         self.enabled = config.get("enabled", True)
         self.timezone = config.get("timezone", "America/Chicago")
+        self.timezones = config.get("timezones", dict())
+        self.processed = {
+            guild_id: datetime.date.fromisoformat(day) for guild_id, day in config.get("processed", dict()).items()
+        }
         self.messages = config.get("messages", dict())
-        self.bot.loop.create_task(self._handle_birthdays())
-
-    async def _update_birthdays(self):
-        await self.db.find_one_and_update(
-            {"_id": "birthdays"}, {"$set": {"birthdays": self.birthdays}}, upsert=True
-        )
+        await self._migrate_birthdays()
+        await self._load_expiries()
+        # Replaying missed days needs the guild cache, before that every guild looks gone
+        await self.bot.wait_until_ready()
+        self.tasks.append(self.bot.loop.create_task(self._handle_birthdays()))
+        self.tasks.append(self.bot.loop.create_task(self._run_expiries()))
+
+    async def _migrate_birthdays(self):
+        await self.db.create_index([("type", 1), ("guild", 1), ("month", 1), ("day", 1)])
+
+        # Birthdays used to be stored in a single document keyed by user id
+        legacy = await self.db.find_one({"_id": "birthdays"})
+        if legacy is None:
+            return
+        if legacy.get("birthdays"):
+            await self.db.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": f"birthday-{user}"},
+                        {"$setOnInsert": {"type": "birthday", "user": user, **obj}},
+                        upsert=True,
+                    )
+                    for user, obj in legacy["birthdays"].items()
+                ],
+                ordered=False,
+            )
+        await self.db.delete_one({"_id": "birthdays"})
+        logger.info(f"Moved {len(legacy.get('birthdays', {}))} birthdays to their own documents.")
 
     async def _update_config(self):
         await self.db.find_one_and_update(
@@ -79,61 +123,178 @@ class BirthdayPlugin(commands.Cog):
                     "channels": self.channels,
                     "enabled": self.enabled,
                     "timezone": self.timezone,
+                    "timezones": self.timezones,
                     "messages": self.messages,
                 }
             },
             upsert=True,
         )
+        self.schedule_changed.set()
+
+    async def _load_expiries(self):
+        async for document in self.db.find({"type": "expiry"}, {"expires": 1}):
+            self.expiries[document["_id"]] = document["expires"]
+            self.expiry_schedule.append((document["expires"], document["_id"]))
+        heapq.heapify(self.expiry_schedule)
+
+    async def _schedule_expiry(self, guild_id, user, role_id):
+        key = f"expiry-{guild_id}-{user}"
+        expires = time.time() + ROLE_DURATION
+        await self.db.update_one(
+            {"_id": key},
+            {"$set": {"type": "expiry", "guild": guild_id, "user": user, "role": role_id, "expires": expires}},
+            upsert=True,
+        )
+        self._push_expiry(key, expires)
 
-    async def _handle_birthdays(self):
+    def _push_expiry(self, key, expires):
+        self.expiries[key] = expires
+        heapq.heappush(self.expiry_schedule, (expires, key))
+        self.expiry_changed.set()
+
+    async def _run_expiries(self):
         while True:
-            if not self.enabled:
-                return
+            self.expiry_changed.clear()
+            # Entries replaced by a later expiry stay in the heap until they surface
+            while self.expiry_schedule and self.expiries.get(self.expiry_schedule[0][1]) != self.expiry_schedule[0][0]:
+                heapq.heappop(self.expiry_schedule)
 
-            custom_timezone = timezone(self.timezone)
-            now = datetime.datetime.now(custom_timezone)
+            if not self.expiry_schedule:
+                await self.expiry_changed.wait()
+                continue
 
-            if self.booted:
-                sleep_time = (
-                    now.replace(hour=0, minute=15, second=0, microsecond=0) - now
-                ).total_seconds()
-                self.booted = False
-                await asyncio.sleep(sleep_time)
+            delay = self.expiry_schedule[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.expiry_changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
                 continue
 
-            today = now.strftime("%d/%m/%Y").split("/")
-            for user, obj in self.birthdays.items():
-                if str(obj["month"]) != today[1] or str(obj["day"]) != today[0]:
-                    continue
-                guild = self.bot.get_guild(int(obj["guild"]))
-                if guild is None:
-                    continue
-                member = guild.get_member(int(user))
-                if member is None:
-                    continue
-
-                if self.roles[obj["guild"]]:
-                    role = guild.get_role(int(self.roles[obj["guild"]]))
-                    if role:
-                        await member.add_roles(role, reason="Birthday Boi")
-
-                if self.messages[obj["guild"]] and self.channels[obj["guild"]]:
-                    channel = guild.get_channel(int(self.channels[obj["guild"]]))
-                    if channel is None:
-                        continue
-                    age = int(today[2]) - obj["year"]
-                    await channel.send(
-                        self.messages[obj["guild"]]
-                        .replace("{user.mention}", member.mention)
-                        .replace("{user}", str(member))
-                        .replace("{age}", str(age))
-                    )
+            _, key = heapq.heappop(self.expiry_schedule)
+            del self.expiries[key]
+            self.removals.put_nowait(key)
 
-            # Calculate time until next midnight
-            now = datetime.datetime.now(custom_timezone)
-            next_midnight = now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
-            sleep_time = (next_midnight - now).total_seconds()
-            await asyncio.sleep(sleep_time)
+    async def _run_removals(self):
+        while True:
+            key = await self.removals.get()
+            try:
+                done = await self._expire_role(key)
+            except Exception as e:
+                logger.error(f"Error removing birthday role ({key}): {e}")
+                done = False
+            if not done and key not in self.expiries:
+                self._push_expiry(key, time.time() + REMOVAL_RETRY)
+            await asyncio.sleep(REMOVAL_INTERVAL)
+
+    async def _expire_role(self, key):
+        """
+        Returns False when the role could not be removed yet and the expiry has to be retried.
+        """
+        document = await self.db.find_one({"_id": key})
+        if document is None or key in self.expiries:
+            # Cleared, or the member got the role again and the expiry was pushed back
+            return True
+
+        guild = self.bot.get_guild(int(document["guild"]))
+        if guild is None:
+            return False
+
+        # A member who left or a deleted role leaves nothing to remove
+        member = guild.get_member(int(document["user"]))
+        role = guild.get_role(int(document["role"]))
+        if member is not None and role is not None and role in member.roles:
+            await member.remove_roles(role, reason="Birthday is over")
+        await self.db.delete_one({"_id": key, "expires": document["expires"]})
+        return True
+
+    def _guild_timezone(self, guild_id):
+        return timezone(self.timezones.get(guild_id, self.timezone))
+
+    async def _handle_birthdays(self):
+        """
+        Processes every guild's birthdays at midnight in the guild's own timezone.
+
+        Each guild keeps the last date it was processed for, days missed while the bot
+        was offline are replayed once, up to `MAX_CATCH_UP_DAYS` back.
+        """
+        while True:
+            self.schedule_changed.clear()
+            guild_ids = set(self.roles) | set(self.channels)
+            for guild_id in guild_ids:
+                try:
+                    await self._catch_up(guild_id)
+                except Exception as e:
+                    logger.error(f"Error processing birthdays for guild {guild_id}: {e}")
+
+            now = datetime.datetime.now(pytz.utc)
+            sleep_time = 24 * 60 * 60
+            for guild_id in guild_ids:
+                tz = self._guild_timezone(guild_id)
+                tomorrow = now.astimezone(tz).date() + datetime.timedelta(days=1)
+                next_midnight = tz.localize(datetime.datetime.combine(tomorrow, datetime.time()))
+                sleep_time = min(sleep_time, (next_midnight - now).total_seconds())
+            try:
+                await asyncio.wait_for(self.schedule_changed.wait(), timeout=max(sleep_time, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _catch_up(self, guild_id):
+        guild = self.bot.get_guild(int(guild_id))
+        if guild is None:
+            # Keep the watermark so the days are announced if the guild comes back
+            return
+
+        today = datetime.datetime.now(self._guild_timezone(guild_id)).date()
+        last = self.processed.get(guild_id)
+        if last is None:
+            day = today
+        else:
+            day = max(last + datetime.timedelta(days=1), today - datetime.timedelta(days=MAX_CATCH_UP_DAYS - 1))
+
+        while day <= today:
+            # The watermark moves first, a crash mid-day skips the rest of it instead of announcing twice
+            self.processed[guild_id] = day
+            await self.db.update_one(
+                {"_id": "config"}, {"$set": {f"processed.{guild_id}": day.isoformat()}}, upsert=True
+            )
+            # Days that pass while the plugin is disabled are marked as processed without announcing
+            if self.enabled:
+                await self._process_day(guild, guild_id, day, day == today)
+            day += datetime.timedelta(days=1)
+
+    async def _process_day(self, guild, guild_id, day, is_today):
+        query = {"type": "birthday", "guild": guild_id, "month": day.month, "day": day.day}
+        async for obj in self.db.find(query, {"user": 1, "year": 1}):
+            user = obj["user"]
+            member = guild.get_member(int(user))
+            if member is None:
+                continue
+            try:
+                await self._celebrate(guild, guild_id, member, obj, day, is_today)
+            except Exception as e:
+                # The day is already marked as processed, so one member must not cost the rest theirs
+                logger.error(f"Error celebrating the birthday of {user} in guild {guild_id}: {e}")
+
+    async def _celebrate(self, guild, guild_id, member, obj, day, is_today):
+        # Birthdays replayed from earlier days are only announced, their day is already over
+        if is_today and self.roles.get(guild_id):
+            role = guild.get_role(int(self.roles[guild_id]))
+            if role:
+                await member.add_roles(role, reason="Birthday Boi")
+                await self._schedule_expiry(guild_id, obj["user"], self.roles[guild_id])
+
+        if self.messages.get(guild_id) and self.channels.get(guild_id):
+            channel = guild.get_channel(int(self.channels[guild_id]))
+            if channel is None:
+                return
+            age = day.year - obj["year"]
+            await channel.send(
+                self.messages[guild_id]
+                .replace("{user.mention}", member.mention)
+                .replace("{user}", str(member))
+                .replace("{age}", str(age))
+            )
 
     @commands.group(invoke_without_command=True)
     async def birthday(self, ctx: commands.Context):
@@ -166,8 +327,11 @@ class BirthdayPlugin(commands.Cog):
                 "guild": str(ctx.guild.id),
             }
 
-            self.birthdays[str(ctx.author.id)] = birthday_obj
-            await self._update_birthdays()
+            await self.db.update_one(
+                {"_id": f"birthday-{ctx.author.id}"},
+                {"$set": {"type": "birthday", "user": str(ctx.author.id), **birthday_obj}},
+                upsert=True,
+            )
             await ctx.send(f"Done! Your birthday was set to {date}")
         except (KeyError, ValueError) as e:
             logger.error(f"Error setting birthday: {e}")
@@ -181,8 +345,7 @@ class BirthdayPlugin(commands.Cog):
         """
         Clear your birthday from the database.
         """
-        self.birthdays.pop(str(ctx.author.id), None)  # Handle case if key doesn't exist
-        await self._update_birthdays()
+        await self.db.delete_one({"_id": f"birthday-{ctx.author.id}"})
         await ctx.send("Done!")
 
     @birthday.command()
@@ -234,7 +397,7 @@ class BirthdayPlugin(commands.Cog):
     @checks.has_permissions(PermissionLevel.ADMIN)
     async def timezone(self, ctx: commands.Context, timezone: str):
         """
-        Set a timezone
+        Set the timezone birthdays are announced in for this server
         """
         if timezone not in pytz.all_timezones:
             matches = get_close_matches(timezone, pytz.all_timezones)
@@ -246,7 +409,7 @@ class BirthdayPlugin(commands.Cog):
                 await ctx.send("Couldn't find the timezone.")
             return
 
-        self.timezone = timezone
+        self.timezones[str(ctx.guild.id)] = timezone
         await self._update_config()
         await ctx.send("Done!")
 
@@ -0,0 +1,398 @@
+"""
+Benchmarks for the giveaway plugin that run without a bot or a database.
+
+    python giveaway/benchmark.py sampler
+    python giveaway/benchmark.py load --giveaways 100 --entrants 50000
+
+`sampler` times the winner draw, `load` replays a reaction stream against in-process stand-ins for the bot,
+its channels, messages and the plugin database partition, and reports scheduler wakeups, API calls,
+database writes and winner draw latency.
+
+discord.py and pymongo have to be installed, the modmail `core` package is replaced by stand-ins.
+"""
+import argparse
+import asyncio
+import copy
+import importlib.util
+import logging
+import random
+import sys
+import time
+import types
+from collections import Counter
+from pathlib import Path
+
+
+def load_plugin():
+    core = types.ModuleType("core")
+    checks = types.ModuleType("core.checks")
+    checks.has_permissions = lambda level: (lambda func: func)
+    models = types.ModuleType("core.models")
+    models.PermissionLevel = types.SimpleNamespace(ADMIN=4)
+    models.getLogger = logging.getLogger
+    core.checks, core.models = checks, models
+    sys.modules.update({"core": core, "core.checks": checks, "core.models": models})
+
+    spec = importlib.util.spec_from_file_location("giveaway", Path(__file__).with_name("giveaway.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+plugin_module = None
+
+# Every call the plugin makes to Discord or the database is counted here
+calls = Counter()
+
+
+class FakeMember:
+    __slots__ = ("id", "bot", "guild", "roles")
+
+    def __init__(self, id, bot=False, guild=None, roles=()):
+        self.id = id
+        self.bot = bot
+        self.guild = guild
+        self.roles = list(roles)
+
+    async def send(self, content):
+        calls["api: dm"] += 1
+
+
+class FakeRole:
+    def __init__(self, id, members, name="Role"):
+        self.id = id
+        self.members = members
+        self.name = name
+
+
+class FakeGuild:
+    name = "Benchmark"
+
+    def __init__(self, members, roles=()):
+        self.members = {member.id: member for member in members}
+        self.roles = {role.id: role for role in roles}
+
+    def get_member(self, id):
+        return self.members.get(id)
+
+    def get_role(self, id):
+        return self.roles.get(id)
+
+
+class FakePartialMessage:
+    def __init__(self, channel, id):
+        self.channel = channel
+        self.id = id
+
+    async def edit(self, **kwargs):
+        calls["api: edit message"] += 1
+
+    async def remove_reaction(self, emoji, member):
+        calls["api: remove reaction"] += 1
+
+
+class FakeReactionUsers:
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+
+    async def flatten(self):
+        # Discord returns reaction users 100 per request
+        calls["api: reaction users"] += -(-len(self.user_ids) // 100)
+        return [FakeMember(user_id) for user_id in self.user_ids]
+
+
+class FakeReaction:
+    def __init__(self, emoji, user_ids):
+        self.emoji = emoji
+        self.user_ids = user_ids
+
+    def users(self):
+        return FakeReactionUsers(list(self.user_ids))
+
+
+class FakeMessage(FakePartialMessage):
+    def __init__(self, channel, id):
+        super().__init__(channel, id)
+        self.embeds = [plugin_module.discord.Embed(title="Item")]
+        self.reactions = [FakeReaction("🎉", channel.reactions.get(id, set()))]
+        self.jump_url = f"https://discord.com/channels/0/{channel.id}/{id}"
+
+
+class FakeChannel:
+    def __init__(self, id):
+        self.id = id
+        # message id -> ids of the users that reacted with 🎉, as Discord sees them
+        self.reactions = {}
+
+    def get_partial_message(self, id):
+        return FakePartialMessage(self, id)
+
+    async def fetch_message(self, id):
+        calls["api: fetch message"] += 1
+        return FakeMessage(self, id)
+
+    async def send(self, content=None, **kwargs):
+        calls["api: send message"] += 1
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """
+    Just enough of a motor collection for the queries and updates of the giveaway plugin.
+    """
+
+    def __init__(self):
+        self.documents = {}
+
+    @staticmethod
+    def _matches(document, query):
+        for key, expected in query.items():
+            value = document.get(key)
+            if isinstance(expected, dict) and "$in" in expected:
+                if value not in expected["$in"]:
+                    return False
+            elif value != expected:
+                return False
+        return True
+
+    @staticmethod
+    def _project(document, projection):
+        if not projection:
+            return copy.deepcopy(document)
+        if all(not included for included in projection.values()):
+            return {key: copy.deepcopy(value) for key, value in document.items() if key not in projection}
+        return {key: copy.deepcopy(document[key]) for key in ("_id", *projection) if key in document}
+
+    def _apply(self, query, update, upsert):
+        calls["db: write"] += 1
+        document = next((doc for doc in self.documents.values() if self._matches(doc, query)), None)
+        inserted = document is None
+        if inserted:
+            if not upsert:
+                return
+            document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            self.documents[document["_id"]] = document
+            document.update(update.get("$setOnInsert", {}))
+        document.update(update.get("$set", {}))
+        for key in update.get("$unset", {}):
+            document.pop(key, None)
+        for key, value in update.get("$addToSet", {}).items():
+            values = document.setdefault(key, [])
+            seen = set(values)
+            values.extend(item for item in value["$each"] if item not in seen)
+        for key, value in update.get("$pull", {}).items():
+            removed = set(value["$in"])
+            document[key] = [item for item in document.get(key, []) if item not in removed]
+
+    async def create_index(self, keys, **kwargs):
+        pass
+
+    async def find_one(self, query, projection=None):
+        calls["db: read"] += 1
+        for document in self.documents.values():
+            if self._matches(document, query):
+                return self._project(document, projection)
+        return None
+
+    def find(self, query, projection=None):
+        calls["db: read"] += 1
+        return FakeCursor(
+            [self._project(doc, projection) for doc in self.documents.values() if self._matches(doc, query)]
+        )
+
+    async def update_one(self, query, update, upsert=False):
+        self._apply(query, update, upsert)
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self._apply(operation._filter, operation._doc, operation._upsert)
+
+    async def delete_one(self, query):
+        calls["db: write"] += 1
+        key = next((key for key, doc in self.documents.items() if self._matches(doc, query)), None)
+        if key is not None:
+            del self.documents[key]
+
+    async def delete_many(self, query):
+        calls["db: write"] += 1
+        for key in [key for key, doc in self.documents.items() if self._matches(doc, query)]:
+            del self.documents[key]
+
+
+class FakeBot:
+    def __init__(self, guild, channels):
+        self.user = FakeMember(0, bot=True)
+        self.guild = guild
+        self.channels = {channel.id: channel for channel in channels}
+        self.collection = FakeCollection()
+        self.plugin_db = types.SimpleNamespace(get_partition=lambda cog: self.collection)
+        self.main_color = 0
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+    def get_guild(self, id):
+        return self.guild
+
+
+class CountingEvent(asyncio.Event):
+    async def wait(self):
+        calls["scheduler: wakeups"] += 1
+        return await super().wait()
+
+
+def bench_sampler(plugin, repeat=5):
+    print("winner draw (best of %d)" % repeat)
+    print(f"{'entrants':>10} {'eligible':>9} {'winners':>8} {'ms':>10}")
+    for size in (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000):
+        entrants = list(range(size))
+        for eligible_ratio in (1.0, 0.01):
+            eligible = max(1, int(size * eligible_ratio))
+            members = [FakeMember(id) for id in entrants[:eligible]]
+            # Entrants past `eligible` left the guild, a tenth of the remaining members are bots
+            members.extend(FakeMember(id, bot=True) for id in entrants[eligible : eligible + size // 10])
+            role = FakeRole(1, members[:eligible])
+            guild = FakeGuild(members, [role])
+            for winners in (1, 10, 100):
+                best = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    asyncio.run(plugin.GiveawayPlugin._draw_winners(None, guild, entrants, winners, role.id))
+                    best = min(best, time.perf_counter() - started)
+                print(f"{size:>10} {eligible:>9} {winners:>8} {best * 1000:>10.3f}")
+
+
+async def bench_load(plugin, giveaways, entrants, role_gated, ineligible, duration):
+    rng = random.Random(0)
+    role = FakeRole(1, [], name="Member")
+    guild = FakeGuild([], [role])
+    for user_id in range(1, entrants + 1):
+        has_role = rng.random() >= ineligible
+        member = FakeMember(user_id, guild=guild, roles=[role] if has_role else [])
+        guild.members[user_id] = member
+        if has_role:
+            role.members.append(member)
+    channels = [FakeChannel(1_000 + index) for index in range(max(1, giveaways // 10))]
+    bot = FakeBot(guild, channels)
+
+    # Giveaways are created as if the bot restarted, so loading them from the partition is measured too
+    now = time.time()
+    for index in range(giveaways):
+        message_id = 10_000 + index
+        bot.collection.documents[f"giveaway-{message_id}"] = {
+            "_id": f"giveaway-{message_id}",
+            "type": "giveaway",
+            "ended": False,
+            "item": f"Item {index}",
+            "winners": rng.randint(1, 5),
+            "time": now + duration * (0.5 + 0.5 * index / giveaways),
+            "guild": 1,
+            "channel": channels[index % len(channels)].id,
+            "message": message_id,
+            "role": role.id if index < giveaways * role_gated else None,
+        }
+        bot.collection.documents[f"entrants-{message_id}"] = {"_id": f"entrants-{message_id}", "users": []}
+
+    draw_latencies = []
+    draw_winners = plugin.GiveawayPlugin._draw_winners
+
+    async def timed_draw_winners(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await draw_winners(self, *args, **kwargs)
+        finally:
+            draw_latencies.append(time.perf_counter() - started)
+
+    plugin.GiveawayPlugin._draw_winners = timed_draw_winners
+    cog = plugin.GiveawayPlugin(bot)
+    cog.schedule_changed = CountingEvent()
+    while len(cog.active_giveaways) < giveaways:
+        await asyncio.sleep(0.01)
+    loaded = dict(calls)
+
+    # Everyone enters one giveaway, a tenth of them leave again
+    started = time.perf_counter()
+    events = 0
+    for user_id in range(1, entrants + 1):
+        index = rng.randrange(giveaways)
+        payload = types.SimpleNamespace(
+            emoji="🎉",
+            user_id=user_id,
+            member=guild.members[user_id],
+            message_id=10_000 + index,
+            channel_id=channels[index % len(channels)].id,
+        )
+        reactions = channels[index % len(channels)].reactions.setdefault(payload.message_id, set())
+        reactions.add(user_id)
+        await cog.on_raw_reaction_add(payload)
+        events += 1
+        if rng.random() < 0.1:
+            reactions.discard(user_id)
+            await cog.on_raw_reaction_remove(payload)
+            events += 1
+        if events % 1000 == 0:
+            await asyncio.sleep(0)
+    replay = time.perf_counter() - started
+
+    while cog.active_giveaways:
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.1)
+    dm_stats = cog.dms.stats()
+    pending_removals = cog.removals.qsize()
+    cog.cog_unload()
+
+    print(f"{giveaways} giveaways, {entrants} entrants, {events} reaction events replayed in {replay:.2f}s")
+    print(f"{'startup':<28} {sum(loaded.values()):>8} calls")
+    for name, count in sorted(calls.items()):
+        print(f"{name:<28} {count:>8}")
+    if draw_latencies:
+        draw_latencies.sort()
+        print(
+            f"{'winner draw ms':<28} median {draw_latencies[len(draw_latencies) // 2] * 1000:.3f}, "
+            f"max {draw_latencies[-1] * 1000:.3f}"
+        )
+    print(f"{'removals still queued':<28} {pending_removals:>8}")
+    print(f"{'dms still queued':<28} {dm_stats['depth']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    sampler = subparsers.add_parser("sampler", help="time the winner draw for 1 to 1M entrants")
+    sampler.add_argument("--repeat", type=int, default=5)
+    load = subparsers.add_parser("load", help="replay reactions against many concurrent giveaways")
+    load.add_argument("--giveaways", type=int, default=100)
+    load.add_argument("--entrants", type=int, default=50_000)
+    load.add_argument("--role-gated", type=float, default=0.2, help="share of giveaways that require a role")
+    load.add_argument("--ineligible", type=float, default=0.1, help="share of members without that role")
+    load.add_argument("--duration", type=float, default=5.0, help="seconds until the last giveaway ends")
+    args = parser.parse_args()
+
+    global plugin_module
+    plugin_module = load_plugin()
+    if args.benchmark == "sampler":
+        bench_sampler(plugin_module, args.repeat)
+    else:
+        asyncio.run(
+            bench_load(plugin_module, args.giveaways, args.entrants, args.role_gated, args.ineligible, args.duration)
+        )
+
+
+if __name__ == "__main__":
+    main()
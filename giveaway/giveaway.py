@@ -1,15 +1,120 @@
 import asyncio
 import aiohttp
 import discord
-import math
+import heapq
 import random
 import time
+from collections import deque
 from datetime import datetime
 from discord.ext import commands
 from discord.ext.commands.errors import BadArgument
+from pymongo import UpdateOne
 
 from core import checks
-from core.models import PermissionLevel
+from core.models import PermissionLevel, getLogger
+
+logger = getLogger(__name__)
+
+# Seconds between writes of the entrants that joined or left giveaways.
+ENTRANTS_FLUSH_INTERVAL = 10
+
+# A giveaway's entrants share one document, which MongoDB caps at 16 MB (roughly 900k ids).
+# Larger pools aren't stored and are counted from the reactions when the giveaway ends instead.
+MAX_STORED_ENTRANTS = 500000
+
+# The giveaway embed is only edited when the number of entrants reaches one of these.
+ENTRANT_MILESTONES = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+# Seconds between removals of reactions from members without the required role.
+REMOVAL_INTERVAL = 0.5
+
+# Entrants checked between yields to the event loop while drawing winners.
+DRAW_CHUNK_SIZE = 10000
+
+# Seconds before a giveaway that failed to end is tried again, doubling up to END_RETRY_MAX_DELAY.
+END_RETRY_DELAY = 30
+END_RETRY_MAX_DELAY = 60 * 60
+
+secure_random = random.SystemRandom()
+
+
+def sample_winners(candidates: list, count: int, rng: random.Random = secure_random) -> list:
+    """
+    Pick `count` distinct winners with a partial Fisher-Yates shuffle, O(count) swaps on `candidates` in place.
+    """
+    count = min(count, len(candidates))
+    for index in range(count):
+        pick = rng.randrange(index, len(candidates))
+        candidates[index], candidates[pick] = candidates[pick], candidates[index]
+    return candidates[:count]
+
+
+class DirectMessageQueue:
+    """
+    Send direct messages in the background instead of from event handlers.
+
+    At most `workers` messages are in flight, each worker waits `interval` seconds between messages,
+    a user gets at most one message every `user_interval` seconds, and a message that is already
+    waiting for the same user isn't queued again.
+    """
+
+    def __init__(self, workers: int = 2, interval: float = 1.0, user_interval: float = 5.0):
+        self.queue = asyncio.Queue()
+        self.interval = interval
+        self.user_interval = user_interval
+        self.waiting = set()
+        self.last_sent = {}
+        self.sent = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.latencies = deque(maxlen=100)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    def send(self, user: discord.abc.User, content: str) -> bool:
+        key = (user.id, content)
+        if key in self.waiting:
+            self.deduplicated += 1
+            return False
+        self.waiting.add(key)
+        self.queue.put_nowait((user, content, time.monotonic()))
+        return True
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+            "average_latency": sum(self.latencies) / len(self.latencies) if self.latencies else 0.0,
+            "max_latency": max(self.latencies, default=0.0),
+        }
+
+    async def _worker(self):
+        while True:
+            user, content, queued_at = await self.queue.get()
+            wait = self.last_sent.get(user.id, 0) + self.user_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.waiting.discard((user.id, content))
+            try:
+                await user.send(content)
+                self.sent += 1
+            except discord.HTTPException:
+                self.failed += 1
+            now = time.monotonic()
+            self.latencies.append(now - queued_at)
+            self.last_sent[user.id] = now
+            if len(self.last_sent) > 1000:
+                self.last_sent = {
+                    user_id: sent_at
+                    for user_id, sent_at in self.last_sent.items()
+                    if now - sent_at < self.user_interval
+                }
+            await asyncio.sleep(self.interval)
 
 
 class GiveawayPlugin(commands.Cog):
@@ -21,182 +126,404 @@ class GiveawayPlugin(commands.Cog):
         self.bot: discord.Client = bot
         self.db = bot.plugin_db.get_partition(self)
         self.active_giveaways = {}
+        # Min-heap of (end time, message id), the scheduler only wakes up when the first one is due
+        self.schedule = []
+        self.schedule_changed = asyncio.Event()
+        # message id -> (retry time, failed attempts) of giveaways that failed to end
+        self.end_retries = {}
+        # Entrant ids of active giveaways, kept up to date from 🎉 reactions
+        self.entrants = {}
+        # message id -> {user id: True if added, False if removed} not yet written to the database
+        self.pending_entrants = {}
+        self.flush_lock = asyncio.Lock()
+        # Giveaways loaded from the database, reactions made while the bot was offline are missing from their entrants
+        self.recount = set()
+        # message id -> entrant milestone currently shown on the embed
+        self.milestones = {}
+        self.removals = asyncio.Queue()
+        self.dms = DirectMessageQueue()
+        self.scheduler_task = asyncio.create_task(self._run_scheduler())
+        self.entrants_task = asyncio.create_task(self._flush_entrants_loop())
+        self.removals_task = asyncio.create_task(self._run_removals())
         asyncio.create_task(self._set_giveaways_from_db())
 
+    def cog_unload(self):
+        self.scheduler_task.cancel()
+        self.entrants_task.cancel()
+        self.removals_task.cancel()
+        self.dms.close()
+        asyncio.create_task(self._flush_entrants())
+
     async def _set_giveaways_from_db(self):
+        await self.db.create_index([("type", 1), ("ended", 1), ("time", 1)])
         config = await self.db.find_one({"_id": "config"})
-        if config is None:
-            await self.db.find_one_and_update(
-                {"_id": "config"},
-                {"$set": {"giveaways": dict()}},
-                upsert=True,
-            )
+        migrated = []
+        if config is not None and "giveaways" in config:
+            migrated = await self._migrate_giveaways(config["giveaways"])
 
-        for key, giveaway in config.get("giveaways", {}).items():
+        # Ended giveaways stay in the database for rerolls but are never loaded
+        async for giveaway in self.db.find({"type": "giveaway", "ended": False}, {"_id": 0, "type": 0}):
+            key = str(giveaway["message"])
             if key in self.active_giveaways:
                 continue
-            self.active_giveaways[str(key)] = giveaway
-            self.bot.loop.create_task(self._handle_giveaway(giveaway))
+            self.active_giveaways[key] = giveaway
+            self.recount.add(key)
+            entrants = await self.db.find_one({"_id": f"entrants-{key}"})
+            # Giveaways started before entrants were tracked get them from the reactions when they end
+            if entrants is not None:
+                self.entrants[key] = set(entrants["users"])
+                self.milestones[key] = self._milestone(len(entrants["users"]))
+            self._schedule_giveaway(giveaway)
+
+        # Migrated giveaways still show the old "Time Remaining" text, which nothing updates anymore
+        if migrated:
+            await self.bot.wait_until_ready()
+            for key in migrated:
+                if key in self.active_giveaways:
+                    await self._refresh_giveaway_embed(key)
+
+    async def _migrate_giveaways(self, giveaways: dict) -> list:
+        """
+        Split the old map of every giveaway in the config document into one document per giveaway.
 
-    async def _update_db(self):
-        await self.db.find_one_and_update(
-            {"_id": "config"},
-            {"$set": {"giveaways": self.active_giveaways}},
+        Returns the message ids of the migrated giveaways.
+        """
+        operations = [
+            UpdateOne(
+                {"_id": f"giveaway-{key}"},
+                {"$setOnInsert": {"type": "giveaway", **giveaway}},
+                upsert=True,
+            )
+            for key, giveaway in giveaways.items()
+        ]
+        if operations:
+            await self.db.bulk_write(operations, ordered=False)
+        await self.db.update_one({"_id": "config"}, {"$unset": {"giveaways": ""}})
+        return list(giveaways)
+
+    async def _save_giveaway(self, giveaway):
+        await self.db.update_one(
+            {"_id": f"giveaway-{giveaway['message']}"},
+            {"$set": {"type": "giveaway", **giveaway}},
             upsert=True,
         )
 
-    async def _handle_giveaway(self, giveaway):
-        if str(giveaway["message"]) not in self.active_giveaways or giveaway['ended']:
+    async def _delete_giveaway(self, message_id: str):
+        self.active_giveaways.pop(message_id, None)
+        self.entrants.pop(message_id, None)
+        self.pending_entrants.pop(message_id, None)
+        self.milestones.pop(message_id, None)
+        self.end_retries.pop(message_id, None)
+        self.recount.discard(message_id)
+        await self.db.delete_many({"_id": {"$in": [f"giveaway-{message_id}", f"entrants-{message_id}"]}})
+
+    async def _flush_entrants_loop(self):
+        while True:
+            await asyncio.sleep(ENTRANTS_FLUSH_INTERVAL)
+            try:
+                await self._flush_entrants()
+            except Exception as e:
+                logger.error(f"Failed to save giveaway entrants: {e}")
+
+    async def _flush_entrants(self, message_ids: list = None):
+        """
+        Write the pending entrant changes of the given giveaways, or of all of them.
+        """
+        # Flushes run one at a time, so an earlier $addToSet can't land after a later $pull
+        async with self.flush_lock:
+            if message_ids is None:
+                pending, self.pending_entrants = self.pending_entrants, {}
+            else:
+                pending = {
+                    message_id: self.pending_entrants.pop(message_id)
+                    for message_id in message_ids
+                    if message_id in self.pending_entrants
+                }
+            failed = []
+            for message_id, changes in pending.items():
+                added = [user for user, entered in changes.items() if entered]
+                removed = [user for user, entered in changes.items() if not entered]
+                operations = []
+                if removed:
+                    operations.append(
+                        UpdateOne({"_id": f"entrants-{message_id}"}, {"$pull": {"users": {"$in": removed}}})
+                    )
+                if added:
+                    operations.append(
+                        UpdateOne(
+                            {"_id": f"entrants-{message_id}"},
+                            {"$addToSet": {"users": {"$each": added}}},
+                            upsert=True,
+                        )
+                    )
+                if not operations:
+                    continue
+                try:
+                    await self.db.bulk_write(operations, ordered=True)
+                except Exception as e:
+                    # Keep the changes for the next flush, unless newer ones came in meanwhile
+                    newer = self.pending_entrants.get(message_id, {})
+                    self.pending_entrants[message_id] = {**changes, **newer}
+                    failed.append(f"{message_id} ({e})")
+            if failed:
+                raise RuntimeError(f"Failed to save the entrants of giveaways {', '.join(failed)}")
+
+    def _track_entrant(self, message_id: str, user_id: int, entered: bool):
+        entrants = self.entrants.get(message_id)
+        if entrants is None:
+            return
+        if entered:
+            entrants.add(user_id)
+        else:
+            entrants.discard(user_id)
+        if len(entrants) > MAX_STORED_ENTRANTS and message_id not in self.recount:
+            logger.warning(f"Giveaway {message_id} has too many entrants to store, they'll be counted when it ends")
+            self.recount.add(message_id)
+            self.pending_entrants.pop(message_id, None)
+            asyncio.create_task(self.db.delete_one({"_id": f"entrants-{message_id}"}))
+        if len(entrants) <= MAX_STORED_ENTRANTS:
+            self.pending_entrants.setdefault(message_id, {})[user_id] = entered
+
+        milestone = self._milestone(len(entrants))
+        if milestone > self.milestones.get(message_id, 0):
+            self.milestones[message_id] = milestone
+            asyncio.create_task(self._refresh_giveaway_embed(message_id))
+
+    @staticmethod
+    def _milestone(entrants: int) -> int:
+        return max((milestone for milestone in ENTRANT_MILESTONES if milestone <= entrants), default=0)
+
+    def _render_giveaway(self, giveaway) -> discord.Embed:
+        """
+        Build the embed of an active giveaway.
+
+        The countdown is a relative timestamp that Discord clients render themselves, so the embed only
+        has to be edited when something else on it changes.
+        """
+        description = f"React with 🎉 to enter the giveaway!\nEnds <t:{int(giveaway['time'])}:R>"
+        if giveaway['role'] is not None:
+            description = description + f"\nMust have role: <@&{giveaway['role']}>"
+        milestone = self.milestones.get(str(giveaway.get("message")), 0)
+        if milestone:
+            description = description + f"\nEntrants: **{milestone}+**"
+
+        embed = discord.Embed(colour=0x00FF00, title=giveaway["item"], description=description)
+        embed.set_footer(
+            text=f"{giveaway['winners']} {'winners' if giveaway['winners'] > 1 else 'winner'} | Ends at"
+        )
+        embed.timestamp = datetime.fromtimestamp(giveaway["time"])
+        return embed
+
+    async def _refresh_giveaway_embed(self, message_id: str):
+        giveaway = self.active_giveaways.get(message_id)
+        if giveaway is None:
             return
+        channel: discord.TextChannel = self.bot.get_channel(int(giveaway["channel"]))
+        if channel is None:
+            return
+        try:
+            await channel.get_partial_message(int(message_id)).edit(embed=self._render_giveaway(giveaway))
+        except discord.HTTPException as e:
+            logger.error(f"Failed to update giveaway {message_id}: {e}")
 
-        async def get_random_user(users, _guild, _winners):
-            rnd = random.choice(users)
-            in_guild = _guild.get_member(rnd)
-            if rnd in _winners or in_guild is None or in_guild.id == self.bot.user.id:
-                idk = await get_random_user(users, _guild, _winners)
-                return idk
-            win = [] + _winners
-            win.append(rnd)
-            return win
+    async def _get_entrants(self, message: discord.Message) -> list:
+        """
+        Return the ids of everyone who entered the giveaway on `message`, without paginating the reactions if possible.
+        """
+        message_id = str(message.id)
+        # Giveaways that ran across a restart are counted again from the reactions, once
+        if message_id not in self.recount:
+            if message_id in self.entrants:
+                return list(self.entrants[message_id])
 
+            entrants = await self.db.find_one({"_id": f"entrants-{message_id}"})
+            if entrants is not None:
+                return entrants["users"]
+
+        users = []
+        for r in message.reactions:
+            if r.emoji == "🎉":
+                users = [user.id for user in await r.users().flatten() if user.id != self.bot.user.id]
+        async with self.flush_lock:
+            self.pending_entrants.pop(message_id, None)
+            if len(users) > MAX_STORED_ENTRANTS:
+                # Rerolls count these again from the reactions
+                await self.db.delete_one({"_id": f"entrants-{message_id}"})
+            else:
+                await self.db.update_one(
+                    {"_id": f"entrants-{message_id}"}, {"$set": {"users": users}}, upsert=True
+                )
+        self.recount.discard(message_id)
+        if message_id in self.entrants:
+            self.entrants[message_id] = set(users)
+        return users
+
+    async def _draw_winners(self, guild: discord.Guild, entrants: list, count: int, role_id: int = None) -> list:
+        """
+        Draw up to `count` winners among the entrants that are still in the guild, aren't bots and have the role.
+
+        Large pools are filtered DRAW_CHUNK_SIZE entrants at a time, yielding to the event loop in between.
+        """
+        if guild is None:
+            return []
+        role_members = None
+        if role_id is not None:
+            role = guild.get_role(role_id)
+            if role is not None:
+                role_members = set()
+                members = role.members
+                for start in range(0, len(members), DRAW_CHUNK_SIZE):
+                    role_members.update(member.id for member in members[start : start + DRAW_CHUNK_SIZE])
+                    await asyncio.sleep(0)
+
+        eligible = []
+        for start in range(0, len(entrants), DRAW_CHUNK_SIZE):
+            for user_id in entrants[start : start + DRAW_CHUNK_SIZE]:
+                member = guild.get_member(user_id)
+                if member is None or member.bot:
+                    continue
+                if role_members is not None and user_id not in role_members:
+                    continue
+                eligible.append(user_id)
+            await asyncio.sleep(0)
+        return sample_winners(eligible, count)
+
+    def _notify_winners(self, guild: discord.Guild, winners: list, item: str, jump_url: str):
+        for winner in winners:
+            member = guild.get_member(winner)
+            if member is not None:
+                self.dms.send(member, f"🎉 You have won **{item}** in **{guild.name}**! {jump_url}")
+
+    def _schedule_giveaway(self, giveaway):
+        if giveaway["ended"]:
+            return
+        heapq.heappush(self.schedule, (giveaway["time"], str(giveaway["message"])))
+        self.schedule_changed.set()
+
+    async def _run_scheduler(self):
+        # Channels and guilds of giveaways that ended during downtime aren't cached before this
+        await self.bot.wait_until_ready()
         while True:
-            if str(giveaway["message"]) not in self.active_giveaways or giveaway['ended']:
-                break
-            channel: discord.TextChannel = self.bot.get_channel(
-                int(giveaway["channel"])
-            )
-            if channel is None:
+            self.schedule_changed.clear()
+            if not self.schedule:
+                await self.schedule_changed.wait()
+                continue
+
+            end_time, message_id = self.schedule[0]
+            delay = end_time - time.time()
+            if delay > 0:
                 try:
-                    self.active_giveaways.pop(str(giveaway["message"]))
-                    await self._update_db()
-                except:
+                    await asyncio.wait_for(self.schedule_changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
                     pass
-                return
+                continue
+
+            heapq.heappop(self.schedule)
+            giveaway = self.active_giveaways.get(message_id)
+            retry_time, attempts = self.end_retries.get(message_id, (None, 0))
+            # Cancelled and rescheduled giveaways leave stale entries behind, skip them here
+            if giveaway is None or giveaway["ended"] or end_time not in (giveaway["time"], retry_time):
+                continue
+            try:
+                await self._end_giveaway(giveaway)
+                self.end_retries.pop(message_id, None)
+            except Exception as e:
+                delay = min(END_RETRY_DELAY * 2 ** attempts, END_RETRY_MAX_DELAY)
+                logger.error(f"Failed to end giveaway {message_id}, retrying in {delay}s: {e}")
+                retry_time = time.time() + delay
+                self.end_retries[message_id] = (retry_time, attempts + 1)
+                heapq.heappush(self.schedule, (retry_time, message_id))
+
+    async def _end_giveaway(self, giveaway):
+        channel: discord.TextChannel = self.bot.get_channel(int(giveaway["channel"]))
+        if channel is None:
+            await self._delete_giveaway(str(giveaway["message"]))
+            return
+        try:
             message = await channel.fetch_message(giveaway["message"])
-            if message is None or not message.embeds or message.embeds[0] is None:
-                try:
-                    self.active_giveaways.pop(str(giveaway["message"]))
-                    await self._update_db()
-                except:
-                    pass
-                return
-            guild: discord.Guild = self.bot.get_guild(giveaway["guild"])
-            g_time = giveaway["time"] - time.time()
-
-            if g_time <= 0 and not giveaway["ended"]:
-                if len(message.reactions) <= 0:
-                    embed = message.embeds[0]
-                    embed.description = (
-                        f"Giveaway has ended!\n\nSadly no one participated :("
-                    )
-                    embed.set_footer(
-                        text=f"{giveaway['winners']} {'winners' if giveaway['winners'] > 1 else 'winner'} | Ended at"
-                    )
-                    await message.edit(embed=embed)
-                    giveaway['ended'] = True
-                    self.active_giveaways[str(giveaway["message"])] = giveaway
-                    await self._update_db()
-                    break
-
-                to_break = False
-
-                for r in message.reactions:
-                    if str(giveaway["message"]) not in self.active_giveaways:
-                        break
-
-                    if r.emoji == "🎉":
-                        reactions = r
-                        reacted_users = await reactions.users().flatten()
-                        if len(reacted_users) <= 1:
-                            embed = message.embeds[0]
-                            embed.description = (
-                                f"Giveaway has ended!\n\nSadly no one participated :("
-                            )
-                            embed.set_footer(
-                                text=f"{giveaway['winners']} {'winners' if giveaway['winners'] > 1 else 'winner'} | "
-                                f"Ended at"
-                            )
-                            await message.edit(embed=embed)
-                            giveaway['ended'] = True
-                            self.active_giveaways[str(giveaway["message"])] = giveaway
-                            await self._update_db()
-                            del guild, channel, reacted_users, embed
-                            break
-
-                        # -1 cuz 1 for self
-                        if giveaway["winners"] > (len(reacted_users) - 1):
-                            giveaway["winners"] = len(reacted_users) - 1
-
-                        winners = []
-
-                        for index in range(len(reacted_users)):
-                            reacted_users[index] = reacted_users[index].id
-
-                        for _ in range(giveaway["winners"]):
-                            winners = await get_random_user(
-                                reacted_users, guild, winners
-                            )
-
-                        embed = message.embeds[0]
-                        winners_text = ""
-                        for winner in winners:
-                            winners_text += f"<@{winner}> "
-
-                        embed.description = f"Giveaway has ended!\n\n**{'Winners' if giveaway['winners'] > 1 else 'Winner'}:** {winners_text} "
-                        embed.set_footer(
-                            text=f"{giveaway['winners']} {'winners' if giveaway['winners'] > 1 else 'winner'} | "
-                            f"Ended at"
-                        )
-                        await message.edit(embed=embed)
-                        await channel.send(
-                            f"🎉 Congratulations {winners_text}, you have won **{giveaway['item']}**!"
-                        )
-                        try:
-                            giveaway['ended'] = True
-                            self.active_giveaways[str(giveaway["message"])] = giveaway
-                            await self._update_db()
-                        except:
-                            pass
-                        del winners_text, winners, guild, channel, reacted_users, embed
-                        to_break = True
-                        break
-
-                if to_break:
-                    break
-            else:
+        except discord.NotFound:
+            message = None
+        if message is None or not message.embeds or message.embeds[0] is None:
+            await self._delete_giveaway(str(giveaway["message"]))
+            return
+        guild: discord.Guild = self.bot.get_guild(giveaway["guild"])
 
-                time_remaining = f"{math.floor(g_time // 86400)} Days, {math.floor(g_time // 3600 % 24)} Hours, {math.floor(g_time // 60 % 60)} Minutes, {math.floor(g_time % 60)} Seconds "
-                description =  f"React with 🎉 to enter the giveaway!\nTime Remaining: **{time_remaining}**"
+        # Only this giveaway's changes, a failing write of another one must not keep this one from ending
+        await self._flush_entrants([str(giveaway["message"])])
+        entrants = await self._get_entrants(message)
+        self.entrants.pop(str(giveaway["message"]), None)
+        self.milestones.pop(str(giveaway["message"]), None)
 
-                if giveaway['role'] is not None:
-                    description = description + f"\nMust have role: <@&{giveaway['role']}>"
+        winners = await self._draw_winners(guild, entrants, giveaway["winners"], giveaway["role"])
+        if winners:
+            giveaway["winners"] = len(winners)
 
-                embed = message.embeds[0]
-                embed.description = description
-                await message.edit(embed=embed)
-                del channel, guild
-                await asyncio.sleep(
-                    60 if g_time > 60 else (5 if g_time > 5 else g_time)
-                )
+        embed = message.embeds[0]
+        embed.set_footer(
+            text=f"{giveaway['winners']} {'winners' if giveaway['winners'] > 1 else 'winner'} | Ended at"
+        )
 
-        return
+        if not winners:
+            embed.description = f"Giveaway has ended!\n\nSadly no one participated :("
+            await message.edit(embed=embed)
+        else:
+            winners_text = ""
+            for winner in winners:
+                winners_text += f"<@{winner}> "
+
+            embed.description = f"Giveaway has ended!\n\n**{'Winners' if giveaway['winners'] > 1 else 'Winner'}:** {winners_text} "
+            await message.edit(embed=embed)
+            await channel.send(
+                f"🎉 Congratulations {winners_text}, you have won **{giveaway['item']}**!"
+            )
+            self._notify_winners(guild, winners, giveaway["item"], message.jump_url)
+
+        giveaway['ended'] = True
+        self.active_giveaways.pop(str(giveaway["message"]), None)
+        await self.db.update_one(
+            {"_id": f"giveaway-{giveaway['message']}"},
+            {"$set": {"ended": True, "winners": giveaway["winners"]}},
+        )
 
     @commands.Cog.listener()
-    async def on_reaction_add(self, reaction: discord.Reaction, user: discord.User):
-        if user.bot or str(reaction.message.id) not in self.active_giveaways.keys():
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        if str(payload.emoji) != "🎉" or payload.user_id == self.bot.user.id:
+            return
+        if payload.member is not None and payload.member.bot:
             return
 
-        giveaway = self.active_giveaways[str(reaction.message.id)]
-        member = reaction.message.guild.get_member(user.id)
+        giveaway = self.active_giveaways.get(str(payload.message_id))
+        if giveaway is None:
+            return
 
-        if giveaway['role'] is not None:
-            role: discord.Role = reaction.message.guild.get_role(giveaway['role'])
-            if role is not None and member not in role.members:
+        if giveaway['role'] is not None and payload.member is not None:
+            role: discord.Role = payload.member.guild.get_role(giveaway['role'])
+            if role is not None and discord.utils.get(payload.member.roles, id=role.id) is None:
+                self.removals.put_nowait((payload.channel_id, payload.message_id, payload.member, role.name))
+                return
+
+        self._track_entrant(str(payload.message_id), payload.user_id, True)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if str(payload.emoji) != "🎉":
+            return
+        self._track_entrant(str(payload.message_id), payload.user_id, False)
+
+    async def _run_removals(self):
+        """
+        Remove the reactions of members without the required role, one every REMOVAL_INTERVAL seconds.
+        """
+        while True:
+            channel_id, message_id, member, role_name = await self.removals.get()
+            channel: discord.TextChannel = self.bot.get_channel(channel_id)
+            if channel is not None:
                 try:
-                    await reaction.remove(user=user)
-                    await user.send(f"You do not have role **{role.name}**. So you can't participate in the giveaway. ")
-                except:
+                    await channel.get_partial_message(message_id).remove_reaction("🎉", member)
+                except discord.HTTPException:
                     pass
+                self.dms.send(member, f"You do not have role **{role_name}**. So you can't participate in the giveaway. ")
+            await asyncio.sleep(REMOVAL_INTERVAL)
 
     @commands.group(
         name="giveaway",
@@ -229,14 +556,11 @@ class GiveawayPlugin(commands.Cog):
         def cancel_check(msg: discord.Message):
             return msg.content == "cancel" or msg.content == f"{ctx.prefix}cancel"
 
-        embed = discord.Embed(colour=0x00FF00)
-
         await ctx.send(embed=self.generate_embed("What is the giveaway item?"))
         giveaway_item = await self.bot.wait_for("message", check=check)
         if cancel_check(giveaway_item) is True:
             await ctx.send("Cancelled.")
             return
-        embed.title = giveaway_item.content
         await ctx.send(
             embed=self.generate_embed("How many winners are to be selected?")
         )
@@ -311,19 +635,7 @@ class GiveawayPlugin(commands.Cog):
 
         if time_cancel is True:
             return
-        
-        description = f"React with 🎉 to enter the giveaway!\n\n"
-        description = description+ f"Time Remaining: **{datetime.fromtimestamp(giveaway_time).strftime('%d %H:%M:%S')}**"
-        if giveaway_role is not None:
-            description = description + f"\nMust have role: <@&{giveaway_role.id}>"
 
-        embed.description = (description)
-        embed.set_footer(
-            text=f"{giveaway_winners} {'winners' if giveaway_winners > 1 else 'winner'} | Ends at"
-        )
-        embed.timestamp = datetime.fromtimestamp(giveaway_time)
-        msg: discord.Message = await channel.send(embed=embed)
-        await msg.add_reaction("🎉")
         giveaway_obj = {
             "ended": False,
             "item": giveaway_item.content,
@@ -331,17 +643,23 @@ class GiveawayPlugin(commands.Cog):
             "time": giveaway_time,
             "guild": ctx.guild.id,
             "channel": channel.id,
-            "message": msg.id
         }
         if giveaway_role is not None:
             giveaway_obj["role"] = giveaway_role.id
         else:
             giveaway_obj['role'] = None
-        
+
+        msg: discord.Message = await channel.send(embed=self._render_giveaway(giveaway_obj))
+        await msg.add_reaction("🎉")
+        giveaway_obj["message"] = msg.id
         self.active_giveaways[str(msg.id)] = giveaway_obj
+        self.entrants[str(msg.id)] = set()
+        await self.db.update_one(
+            {"_id": f"entrants-{msg.id}"}, {"$set": {"users": []}}, upsert=True
+        )
         await ctx.send(f"Done! Giveaway started [here](<{msg.jump_url}>)")
-        await self._update_db()
-        await self._start_new_giveaway_thread(giveaway_obj)
+        await self._save_giveaway(giveaway_obj)
+        self._schedule_giveaway(giveaway_obj)
 
     @checks.has_permissions(PermissionLevel.ADMIN)
     @giveaway.command(name="reroll", aliases=["rroll"])
@@ -358,16 +676,6 @@ class GiveawayPlugin(commands.Cog):
             await ctx.send("Sorry, but you can't reroll an active giveaway.")
             return
 
-        async def get_random_user(users, _guild, _winners):
-            rnd = random.choice(users)
-            in_guild = _guild.get_member(rnd)
-            if rnd in _winners or in_guild is None or in_guild.id == self.bot.user.id:
-                idk = await get_random_user(users, _guild, _winners)
-                return idk
-            win = [] + _winners
-            win.append(rnd)
-            return win
-
         try:
             message = await ctx.channel.fetch_message(int(_id))
         except discord.Forbidden:
@@ -392,46 +700,50 @@ class GiveawayPlugin(commands.Cog):
             await message.edit(embed=embed)
             return
 
-        for r in message.reactions:
-            if r.emoji == "🎉":
-                reactions = r
-                reacted_users = await reactions.users().flatten()
-                if len(reacted_users) <= 1:
-                    embed = message.embeds[0]
-                    embed.description = (
-                        f"Giveaway has ended!\n\nSadly no one participated :("
-                    )
-                    await message.edit(embed=embed)
-                    del reacted_users, embed
-                    break
-
-                # -1 cuz 1 for self
-                if winners_count > (len(reacted_users) - 1):
-                    winners_count = len(reacted_users) - 1
-
-                winners = []
+        giveaway = await self.db.find_one({"_id": f"giveaway-{_id}"}, {"role": 1})
+        entrants = await self._get_entrants(message)
+        winners = await self._draw_winners(ctx.guild, entrants, winners_count, giveaway and giveaway.get("role"))
+        if not winners:
+            embed = message.embeds[0]
+            embed.description = (
+                f"Giveaway has ended!\n\nSadly no one participated :("
+            )
+            await message.edit(embed=embed)
+            return
 
-                for index in range(len(reacted_users)):
-                    reacted_users[index] = reacted_users[index].id
+        winners_count = len(winners)
 
-                for _ in range(winners_count):
-                    winners = await get_random_user(reacted_users, ctx.guild, winners)
+        embed = message.embeds[0]
+        winners_text = ""
+        for winner in winners:
+            winners_text += f"<@{winner}> "
 
-                embed = message.embeds[0]
-                winners_text = ""
-                for winner in winners:
-                    winners_text += f"<@{winner}> "
+        embed.description = f"Giveaway has ended!\n\n**{'Winners' if winners_count > 1 else 'Winner'}:** {winners_text}"
+        embed.set_footer(
+            text=f"{winners_count} {'winners' if winners_count > 1 else 'winner'} | Ended at"
+        )
+        await message.edit(embed=embed)
+        await ctx.channel.send(
+            f"🎉 Congratulations {winners_text}, you have won **{embed.title}**!"
+        )
+        self._notify_winners(ctx.guild, winners, embed.title, message.jump_url)
 
-                embed.description = f"Giveaway has ended!\n\n**{'Winners' if winners_count > 1 else 'Winner'}:** {winners_text}"
-                embed.set_footer(
-                    text=f"{winners_count} {'winners' if winners_count > 1 else 'winner'} | Ended at"
-                )
-                await message.edit(embed=embed)
-                await ctx.channel.send(
-                    f"🎉 Congratulations {winners_text}, you have won **{embed.title}**!"
-                )
-                del winners_text, winners, winners_count, reacted_users, embed
-                break
+    @giveaway.command(name="queue", aliases=["dms"])
+    @checks.has_permissions(PermissionLevel.ADMIN)
+    async def queue(self, ctx: commands.Context):
+        """
+        Show the state of the queue that sends giveaway DMs
+        """
+        stats = self.dms.stats()
+        await ctx.send(
+            embed=self.generate_embed(
+                f"Waiting: **{stats['depth']}**\n"
+                f"Sent: **{stats['sent']}**\n"
+                f"Failed: **{stats['failed']}**\n"
+                f"Deduplicated: **{stats['deduplicated']}**\n"
+                f"Latency (last 100): **{stats['average_latency']:.1f}s** average, **{stats['max_latency']:.1f}s** max"
+            )
+        )
 
     @giveaway.command(name="cancel", aliases=["stop"])
     @checks.has_permissions(PermissionLevel.ADMIN)
@@ -467,14 +779,10 @@ class GiveawayPlugin(commands.Cog):
         embed = message.embeds[0]
         embed.description = "The giveaway has been cancelled."
         await message.edit(embed=embed)
-        self.active_giveaways.pop(_id)
-        await self._update_db()
+        await self._delete_giveaway(_id)
         await ctx.send("Cancelled!")
         return
 
-    async def _start_new_giveaway_thread(self, obj):
-        await self.bot.loop.create_task(self._handle_giveaway(obj))
-
     def generate_embed(self, description: str):
         embed = discord.Embed()
         embed.colour = self.bot.main_color
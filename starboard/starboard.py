@@ -1,5 +1,9 @@
+import asyncio
+import bisect
+import re
 import typing
-from datetime import datetime
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
 
 import discord
 from discord import Client
@@ -7,9 +11,127 @@ from discord.ext import commands
 
 from core import checks
 from core.models import PermissionLevel, getLogger
+from core.utils import truncate
 
 logger = getLogger(__name__)
 
+# Number of source message -> starboard message mappings kept in memory.
+POST_CACHE_SIZE = 5000
+
+# Number of messages whose star reactors are tracked in memory.
+STAR_CACHE_SIZE = 1000
+
+# Board that the single starboard of older versions is migrated to.
+DEFAULT_BOARD = "default"
+
+CUSTOM_EMOJI_RE = re.compile(r"<a?:(\w+):(\d+)>")
+
+
+class StarredMessage:
+    __slots__ = ("message", "reactors")
+
+    def __init__(self, message: typing.Optional[discord.Message], reactors: typing.Set[int]):
+        self.message = message
+        self.reactors = reactors
+
+
+class Board:
+    """
+    A starboard of a guild: messages with at least `stars` reactions of `emoji` get posted in `channel`.
+    """
+    __slots__ = ("guild", "name", "emoji", "channel", "stars")
+
+    def __init__(self, guild: int, name: str, emoji: str, channel: int, stars: int):
+        self.guild = guild
+        self.name = name
+        self.emoji = emoji
+        self.channel = channel
+        self.stars = stars
+
+    @property
+    def key(self) -> str:
+        return emoji_key(self.emoji)
+
+    @property
+    def label(self) -> str:
+        custom = CUSTOM_EMOJI_RE.fullmatch(self.emoji)
+        return f":{custom.group(1)}:" if custom else self.emoji
+
+    def to_dict(self) -> dict:
+        return {"emoji": self.emoji, "channel": self.channel, "stars": self.stars}
+
+
+class Leaderboard:
+    """
+    Star counts of the posted messages of one board, kept sorted so the top of the board is read directly.
+    """
+
+    def __init__(self):
+        # source message id -> (stars, author id, channel id, created at)
+        self.messages: typing.Dict[int, typing.Tuple[int, int, int, datetime]] = dict()
+        self.ranking: typing.List[typing.Tuple[int, int]] = list()
+        self.author_totals: typing.Dict[int, int] = dict()
+        self.author_ranking: typing.List[typing.Tuple[int, int]] = list()
+
+    def update(self, source: int, stars: int, author: int, channel: int, created: datetime):
+        self.remove(source)
+        self.messages[source] = (stars, author, channel, created)
+        bisect.insort(self.ranking, (-stars, source))
+        self._add_to_author(author, stars)
+
+    def remove(self, source: int):
+        entry = self.messages.pop(source, None)
+        if entry is None:
+            return
+        self._discard(self.ranking, (-entry[0], source))
+        self._add_to_author(entry[1], -entry[0])
+
+    def top_messages(self, limit: int, since: datetime = None) -> typing.List[typing.Tuple[int, int, int, int]]:
+        results = []
+        for _, source in self.ranking:
+            stars, author, channel, created = self.messages[source]
+            if since is not None and created < since:
+                continue
+            results.append((source, stars, author, channel))
+            if len(results) >= limit:
+                break
+        return results
+
+    def top_authors(self, limit: int, since: datetime = None) -> typing.List[typing.Tuple[int, int]]:
+        if since is None:
+            return [(author, -total) for total, author in self.author_ranking[:limit]]
+
+        totals = Counter()
+        for stars, author, _, created in self.messages.values():
+            if created >= since:
+                totals[author] += stars
+        return totals.most_common(limit)
+
+    def _add_to_author(self, author: int, stars: int):
+        total = self.author_totals.pop(author, 0)
+        if total:
+            self._discard(self.author_ranking, (-total, author))
+        total += stars
+        if total > 0:
+            self.author_totals[author] = total
+            bisect.insort(self.author_ranking, (-total, author))
+
+    @staticmethod
+    def _discard(ranking: list, item: tuple):
+        index = bisect.bisect_left(ranking, item)
+        if index < len(ranking) and ranking[index] == item:
+            del ranking[index]
+
+
+def emoji_key(emoji: typing.Union[discord.PartialEmoji, discord.Emoji, str]) -> str:
+    """
+    Key an emoji the same way whether it comes from a reaction or from a command argument.
+    """
+    if isinstance(emoji, str):
+        custom = CUSTOM_EMOJI_RE.fullmatch(emoji)
+        return custom.group(2) if custom else emoji
+    return str(emoji.id) if emoji.id else emoji.name
+
 
 class Starboard(commands.Cog):
     """
@@ -18,41 +140,122 @@ class Starboard(commands.Cog):
     def __init__(self, bot):
         self.bot: Client = bot
         self.db = bot.plugin_db.get_partition(self)
-        self.channel = None
-        self.stars = 2
-        self.user_blacklist: list = list()
-        self.channel_blacklist: list = list()
+        self.boards: typing.Dict[int, typing.Dict[str, Board]] = dict()
+        self.routes: typing.Dict[typing.Tuple[int, str], Board] = dict()
+        self.user_blacklist: typing.Dict[int, typing.Set[str]] = dict()
+        self.channel_blacklist: typing.Dict[int, typing.Set[str]] = dict()
+        self.posts: OrderedDict = OrderedDict()
+        self.leaderboards: typing.Dict[typing.Tuple[int, str], Leaderboard] = dict()
+        self.starred: OrderedDict = OrderedDict()
+        self.delay = 2.0
+        # Posts of messages created before this were made without a database mapping, only set on migrated installs
+        self.legacy_posts_before: typing.Optional[datetime] = None
+        self.legacy_posts_guild: typing.Optional[int] = None
+        self.sync_tasks: typing.Dict[typing.Tuple[str, int], asyncio.Task] = dict()
+        self.dirty: typing.Set[typing.Tuple[str, int]] = set()
+        self.counting: typing.Dict[typing.Tuple[str, int], asyncio.Task] = dict()
         self.bot.loop.create_task(self._set_val())
 
     async def _update_db(self):
         await self.db.find_one_and_update(
             {"_id": "config"},
+            {"$set": {"delay": self.delay}},
+            upsert=True,
+        )
+
+    async def _update_guild(self, guild_id: int):
+        await self.db.update_one(
+            {"_id": f"guild-{guild_id}"},
             {
                 "$set": {
-                    "channel": self.channel,
-                    "stars": self.stars,
+                    "guild": guild_id,
+                    "boards": {name: board.to_dict() for name, board in self.boards.get(guild_id, {}).items()},
                     "blacklist": {
-                        "user": self.user_blacklist,
-                        "channel": self.channel_blacklist,
+                        "user": sorted(self.user_blacklist.get(guild_id, ())),
+                        "channel": sorted(self.channel_blacklist.get(guild_id, ())),
                     },
                 }
             },
             upsert=True,
         )
+        self._build_routes()
+
+    def _build_routes(self):
+        """
+        Precompute the (guild, emoji) -> board table, so routing a reaction is one dict lookup however many boards exist.
+        """
+        self.routes = {
+            (board.guild, board.key): board
+            for boards in self.boards.values()
+            for board in boards.values()
+        }
 
     async def _set_val(self):
+        await self.db.create_index(
+            [("source", 1), ("board", 1)],
+            unique=True,
+            partialFilterExpression={"source": {"$exists": True}},
+        )
+
+        async for config in self.db.find({"boards": {"$exists": True}}):
+            guild_id = config["guild"]
+            self.boards[guild_id] = {
+                name: Board(guild_id, name, board["emoji"], board["channel"], board["stars"])
+                for name, board in config["boards"].items()
+            }
+            self.user_blacklist[guild_id] = set(config["blacklist"]["user"])
+            self.channel_blacklist[guild_id] = set(config["blacklist"]["channel"])
+
+        async for post in self.db.find(
+            {"source": {"$exists": True}, "stars": {"$exists": True}},
+            {"source": 1, "board": 1, "guild": 1, "stars": 1, "author": 1, "channel": 1, "created": 1},
+        ):
+            self._leaderboard(post["guild"], post["board"]).update(
+                post["source"], post["stars"], post["author"], post["channel"], post["created"]
+            )
+
         config = await self.db.find_one({"_id": "config"})
 
         if config is None:
             await self._update_db()
-            return
+        else:
+            self.delay = config.get("delay", 2.0)
+            self.legacy_posts_before = config.get("legacy_posts_before")
+            self.legacy_posts_guild = config.get("legacy_posts_guild")
+            if "blacklist" in config:
+                await self._migrate_single_board(config)
 
-        self.channel = config.get("channel", None)
-        self.stars = config.get("stars", 2)
-        self.user_blacklist = config["blacklist"]["user"]
-        self.channel_blacklist = config["blacklist"]["channel"]
+        self._build_routes()
+
+    async def _migrate_single_board(self, config: dict):
+        """
+        Move the old single starboard config into the `default` board of the modmail guild.
+        """
+        guild_id = int(self.bot.config["guild_id"])
+        if config.get("channel"):
+            self.boards.setdefault(guild_id, dict())[DEFAULT_BOARD] = Board(
+                guild_id, DEFAULT_BOARD, "⭐", int(config["channel"]), config.get("stars", 2)
+            )
+        self.user_blacklist[guild_id] = set(config["blacklist"]["user"])
+        self.channel_blacklist[guild_id] = set(config["blacklist"]["channel"])
+        await self._update_guild(guild_id)
+
+        await self.db.update_many(
+            {"source": {"$exists": True}, "board": {"$exists": False}},
+            {"$set": {"board": DEFAULT_BOARD}},
+        )
+        self.legacy_posts_before = datetime.utcnow()
+        self.legacy_posts_guild = guild_id
+        await self.db.update_one(
+            {"_id": "config"},
+            {
+                "$set": {"legacy_posts_before": self.legacy_posts_before, "legacy_posts_guild": guild_id},
+                "$unset": {"channel": "", "stars": "", "blacklist": ""},
+            },
+        )
 
     @commands.group(aliases=["st", "sb"], invoke_without_command=True)
+    @commands.guild_only()
     @checks.has_permissions(PermissionLevel.ADMIN)
     async def starboard(self, ctx: commands.Context):
         await ctx.send_help(ctx.command)
@@ -61,30 +264,160 @@ class Starboard(commands.Cog):
     @checks.has_permissions(PermissionLevel.ADMIN)
     async def channel(self, ctx: commands.Context, channel: discord.TextChannel):
         """
-        Set the starboard channel where the messages will go
+        Set the channel of the default ⭐ board where the messages will go
         **Usage:**
         starboard channel **#this-is-a-channel**
         """
-        self.channel = str(channel.id)
-        await self._update_db()
+        boards = self.boards.setdefault(ctx.guild.id, dict())
+        if DEFAULT_BOARD in boards:
+            boards[DEFAULT_BOARD].channel = channel.id
+        else:
+            existing = self.routes.get((ctx.guild.id, emoji_key("⭐")))
+            if existing is not None:
+                await ctx.send(
+                    f"⭐ is already used by the `{existing.name}` board, "
+                    f"change its emoji or use `starboard add {DEFAULT_BOARD}` with another one."
+                )
+                return
+            boards[DEFAULT_BOARD] = Board(ctx.guild.id, DEFAULT_BOARD, "⭐", channel.id, 2)
+        await self._update_guild(ctx.guild.id)
 
         await ctx.send(f"Done! {channel.mention} is the Starboard Channel now!")
 
     @starboard.command(aliases=["setstars", "ss"])
     @checks.has_permissions(PermissionLevel.ADMIN)
-    async def stars(self, ctx: commands.Context, stars: int):
+    async def stars(self, ctx: commands.Context, stars: int, name: str = DEFAULT_BOARD):
         """
-        Set the number of stars the message needs to appear on the starboard channel
+        Set the number of stars the message needs to appear on a board (the default ⭐ board if none is given)
         **Usage:**
         starboard stars 2
+        starboard stars 5 fire
         """
-        self.stars = stars
-        await self._update_db()
+        board = self.boards.get(ctx.guild.id, {}).get(name)
+        if board is None:
+            await ctx.send(f"There is no board named `{name}`, set its channel first.")
+            return
+
+        board.stars = stars
+        await self._update_guild(ctx.guild.id)
 
         await ctx.send(
-            f"Done.Now this server needs `{stars}` :star: to appear on the starboard channel."
+            f"Done.Now this server needs `{stars}` {board.emoji} to appear on the `{name}` board."
         )
 
+    @starboard.command(name="add", aliases=["addboard", "ab"])
+    @checks.has_permissions(PermissionLevel.ADMIN)
+    async def add_board(
+            self, ctx: commands.Context, name: str, channel: discord.TextChannel, emoji: str, stars: int = 2
+    ):
+        """
+        Add a board with its own emoji, channel and threshold, or update an existing one
+        **Usage:**
+        starboard add fire **#hot-takes** 🔥 5
+        """
+        key = emoji_key(emoji)
+        existing = self.routes.get((ctx.guild.id, key))
+        if existing is not None and existing.name != name:
+            await ctx.send(f"{emoji} is already used by the `{existing.name}` board.")
+            return
+
+        self.boards.setdefault(ctx.guild.id, dict())[name] = Board(ctx.guild.id, name, emoji, channel.id, stars)
+        await self._update_guild(ctx.guild.id)
+
+        await ctx.send(f"Done! Messages with `{stars}` {emoji} will go to {channel.mention}.")
+
+    @starboard.command(name="remove", aliases=["removeboard", "rb"])
+    @checks.has_permissions(PermissionLevel.ADMIN)
+    async def remove_board(self, ctx: commands.Context, name: str):
+        """
+        Remove a board, its existing posts are left as they are
+        **Usage:**
+        starboard remove fire
+        """
+        if self.boards.get(ctx.guild.id, {}).pop(name, None) is None:
+            await ctx.send(f"There is no board named `{name}`.")
+            return
+
+        await self._update_guild(ctx.guild.id)
+        await ctx.send(f"Removed the `{name}` board.")
+
+    @starboard.command(name="boards", aliases=["list"])
+    @checks.has_permissions(PermissionLevel.ADMIN)
+    async def list_boards(self, ctx: commands.Context):
+        """
+        List the boards of this server
+        """
+        boards = self.boards.get(ctx.guild.id)
+        if not boards:
+            await ctx.send("This server has no boards yet.")
+            return
+
+        await ctx.send(
+            "\n".join(
+                f"`{board.name}`: {board.emoji} x{board.stars} -> <#{board.channel}>"
+                for board in boards.values()
+            )
+        )
+
+    @starboard.command(aliases=["setdelay", "sd"])
+    @checks.has_permissions(PermissionLevel.ADMIN)
+    async def delay(self, ctx: commands.Context, seconds: float):
+        """
+        Set how long to wait for more stars before updating a starboard message
+        **Usage:**
+        starboard delay 2
+        """
+        if not 0 <= seconds <= 60:
+            await ctx.send("The delay has to be between 0 and 60 seconds.")
+            return
+
+        self.delay = seconds
+        await self._update_db()
+
+        await ctx.send(f"Done. Starboard messages will be updated `{seconds}` seconds after a star.")
+
+    @starboard.command(aliases=["leaderboard", "lb"])
+    @checks.has_permissions(PermissionLevel.ADMIN)
+    async def top(self, ctx: commands.Context, days: int = 0, name: str = DEFAULT_BOARD):
+        """
+        Show the most starred messages and authors of a board, of all time or of the last few days
+        **Usage:**
+        starboard top
+        starboard top 7
+        starboard top 30 fire
+        """
+        leaderboard = self.leaderboards.get((ctx.guild.id, name))
+        since = datetime.utcnow() - timedelta(days=days) if days > 0 else None
+        messages = leaderboard.top_messages(10, since) if leaderboard else []
+        if not messages:
+            await ctx.send(f"Nothing has made it to the `{name}` board yet.")
+            return
+
+        board = self.boards.get(ctx.guild.id, {}).get(name)
+        label = board.emoji if board else name
+        # Ten jump links are well over the 1024 characters of a field, the description holds 4096
+        embed = discord.Embed(
+            color=discord.Colour.gold(),
+            title=f"Top of the {name} board" + (f" in the last {days} days" if since else ""),
+            description="\n".join(
+                f"**{index}.** {label} {stars} [Jump](https://discord.com/channels/{ctx.guild.id}/{channel}/{source})"
+                f" by <@{author}>"
+                for index, (source, stars, author, channel) in enumerate(messages, start=1)
+            ),
+        )
+        embed.add_field(
+            name="Authors",
+            value=truncate(
+                "\n".join(
+                    f"**{index}.** <@{author}> - {label} {stars}"
+                    for index, (author, stars) in enumerate(leaderboard.top_authors(10, since), start=1)
+                ),
+                1024,
+            ),
+            inline=False,
+        )
+        await ctx.send(embed=embed)
+
     @starboard.group()
     @checks.has_permissions(PermissionLevel.ADMIN)
     async def blacklist(self, ctx: commands.Context):
@@ -102,16 +435,19 @@ class Starboard(commands.Cog):
         **Usage:**
         starboard blacklist member @user
         """
-
-        if str(member.id) in self.user_blacklist:
-            self.user_blacklist.remove(str(member.id))
+        user_blacklist = self.user_blacklist.setdefault(ctx.guild.id, set())
+        if str(member.id) in user_blacklist:
+            user_blacklist.remove(str(member.id))
             removed = True
         else:
-            self.user_blacklist.append(str(member.id))
+            user_blacklist.add(str(member.id))
             removed = False
+        await self._update_guild(ctx.guild.id)
+        # Cached star counts may include this user, recount them on their next star
+        self.starred.clear()
 
         await ctx.send(
-            f"{'Un' if removed else None}Blacklisted **{member.name}#{member.discriminator}**"
+            f"{'Un' if removed else ''}Blacklisted **{member.name}#{member.discriminator}**"
         )
         return
 
@@ -125,16 +461,16 @@ class Starboard(commands.Cog):
         **Usage:**
         starboard blacklist channel **#channel**
         """
-        if str(channel.id) in self.channel_blacklist:
-            self.channel_blacklist.remove(str(channel.id))
-            await self._update_db()
+        channel_blacklist = self.channel_blacklist.setdefault(ctx.guild.id, set())
+        if str(channel.id) in channel_blacklist:
+            channel_blacklist.remove(str(channel.id))
             removed = True
         else:
-            self.channel_blacklist.append(str(channel.id))
-            await self._update_db()
+            channel_blacklist.add(str(channel.id))
             removed = False
+        await self._update_guild(ctx.guild.id)
 
-        await ctx.send(f"{'Un' if removed else None}Blacklisted {channel.mention}")
+        await ctx.send(f"{'Un' if removed else ''}Blacklisted {channel.mention}")
         return
 
     @commands.Cog.listener()
@@ -145,127 +481,291 @@ class Starboard(commands.Cog):
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         await self.handle_reaction(payload=payload)
 
-    async def handle_reaction(self, payload: discord.RawReactionActionEvent):
-        config = await self.db.find_one({"_id": "config"})
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        for board in self.boards.get(payload.guild_id, {}).values():
+            await self._handle_clear(board, payload.channel_id, payload.message_id)
 
-        if not config or not self.channel:
-            logger.info("No config or channel")
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
+        board = self.routes.get((payload.guild_id, emoji_key(payload.emoji)))
+        if board is not None:
+            await self._handle_clear(board, payload.channel_id, payload.message_id)
+
+    async def _handle_clear(self, board: Board, channel_id: int, message_id: int):
+        """
+        Recount a message whose reactions were cleared, if it is cached or has a post that may have to go.
+        """
+        cached = self.starred.pop((board.name, message_id), None) is not None
+        if cached or await self._get_post_id(board, message_id) is not None:
+            await self._refresh_stars(board, channel_id, message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # The cached message is only used to render the embed, refetch it on the next star
+        guild_id = payload.data.get("guild_id")
+        for board in self.boards.get(int(guild_id) if guild_id else None, {}).values():
+            starred = self.starred.get((board.name, payload.message_id))
+            if starred is not None:
+                starred.message = None
+
+    async def handle_reaction(self, payload: discord.RawReactionActionEvent):
+        # Everything up to _refresh_stars is in memory, most reactions aren't for a board and stop here
+        board = self.routes.get((payload.guild_id, emoji_key(payload.emoji)))
+        if board is None:
             return
 
         # check for blacklist
-        if self.channel_blacklist.__contains__(str(payload.channel_id)) or self.user_blacklist.__contains__(
-                str(payload.user_id)):
+        if (
+            str(payload.channel_id) in self.channel_blacklist.get(board.guild, ())
+            or str(payload.user_id) in self.user_blacklist.get(board.guild, ())
+        ):
             logger.info("Blacklisted")
             return
 
-        guild: discord.Guild = self.bot.get_guild(int(self.bot.config["guild_id"]))
-        starboard_channel: discord.TextChannel = guild.get_channel(int(self.channel))
-        channel: discord.TextChannel = guild.get_channel(payload.channel_id)
-        user: discord.User = await self.bot.fetch_user(payload.user_id)
+        await self._refresh_stars(
+            board,
+            payload.channel_id,
+            payload.message_id,
+            payload.user_id,
+            payload.event_type == "REACTION_ADD",
+        )
+
+    async def _refresh_stars(
+            self, board: Board, channel_id: int, message_id: int, user_id: int = None, added: bool = False
+    ):
+        """
+        Apply a reaction added or removed by `user_id` to the cached count of a message and sync its post on `board`.
+
+        The reactors are only fetched from Discord when the message isn't cached yet, or when no user is given.
+        """
+        guild: discord.Guild = self.bot.get_guild(board.guild)
+        if guild is None:
+            return
+        starboard_channel: discord.TextChannel = guild.get_channel(board.channel)
+        channel: discord.TextChannel = guild.get_channel(channel_id)
 
         if not channel or not starboard_channel:
             logger.info("No channel found")
             return
 
-        message: discord.Message = await channel.fetch_message(payload.message_id)
+        key = (board.name, message_id)
+        starred = self.starred.get(key)
+        try:
+            if user_id is None:
+                starred = await self._count_stars(board, channel, message_id)
+            else:
+                if starred is None:
+                    starred = await self._count_once(board, channel, message_id)
+                else:
+                    self.starred.move_to_end(key)
+                if starred.message is None:
+                    starred.message = await channel.fetch_message(message_id)
+                if starred.message.author.id == user_id:
+                    logger.info("Author added the reaction")
+                    return
+                if added:
+                    starred.reactors.add(user_id)
+                else:
+                    starred.reactors.discard(user_id)
+        except discord.NotFound:
+            self.starred.pop(key, None)
+            return
+
+        self._schedule_sync(board, starboard_channel, channel, message_id)
+
+    def _schedule_sync(
+            self, board: Board, starboard_channel: discord.TextChannel, channel: discord.TextChannel, message_id: int
+    ):
+        """
+        Coalesce star changes of a message into a single starboard update, made `self.delay` seconds later.
 
-        if message.author.id == payload.user_id:
-            logger.info("Author added the reaction")
+        There is at most one sync task per message and board, so its updates never race each other.
+        """
+        key = (board.name, message_id)
+        if key in self.sync_tasks:
+            self.dirty.add(key)
             return
+        self.sync_tasks[key] = self.bot.loop.create_task(
+            self._sync_worker(board, starboard_channel, channel, message_id)
+        )
 
-        found_emote = False
-        for emote in message.reactions:
-            if emote.emoji == "⭐":
-                found_emote = True
-                reaction: discord.Reaction = emote
-                count = reaction.count
-                reacted_users: typing.List[discord.User] = await reaction.users().flatten()
-                has_author_reacted = discord.utils.find(lambda u: u.id == message.author.id, reacted_users)
-                if has_author_reacted:
-                    count = count - 1
-
-                should_delete = False
-
-                if count < self.stars:
-                    should_delete = True
-
-                messages = await starboard_channel.history(
-                    limit=70,
-                    around=message.created_at
-                ).flatten()
-                found = False
-
-                for msg in messages:
-                    if len(msg.embeds) <= 0:
-                        logger.info("No embeds")
-                        continue
-
-                    if not msg.embeds[0].footer or not msg.embeds[0].footer.text or "⭐" not in msg.embeds[
-                        0].footer.text:
-                        print(msg.embeds)
-                        logger.info("No stars")
-                        continue
-
-                    if msg.embeds[0].footer.text.endswith(str(payload.message_id)):
-                        logger.info("got one")
-                        found = True
-                        if should_delete:
-                            logger.info("delete message")
-                            await msg.delete()
-                            break
-                        e = msg.embeds[0]
-                        e.set_footer(text=f"⭐ {count} | {payload.message_id}")
-                        await msg.edit(content=f"<#{payload.channel_id}>", embed=e)
-                        break
-
-                if not found:
-                    if should_delete:
-                        logger.info("Should Delete")
-                        return
-
-                    embed = discord.Embed(
-                        color=discord.Colour.gold(),
-                        description=message.content,
-                        timestamp=datetime.utcnow(),
-                        title="Jump to message ►",
-                        url=message.jump_url
-                    )
-                    embed.set_author(
-                        name=str(message.author),
-                        icon_url=message.author.avatar_url,
-                    )
-                    embed.set_footer(text=f"⭐ {count} | {payload.message_id}")
-                    if len(message.attachments) > 1:
-                        try:
-                            embed.set_image(url=message.attachments[0].url)
-                        except:
-                            pass
-
-                    await starboard_channel.send(
-                        f"{channel.mention}", embed=embed
-                    )
-
-        if not found_emote:
-            messages = await starboard_channel.history(
-                limit=70,
-                around=message.created_at
-            ).flatten()
-            found = False
-
-            for msg in messages:
-                if len(msg.embeds) <= 0:
-                    logger.info("No embeds")
-                    continue
-
-                if not msg.embeds[0].footer or not msg.embeds[0].footer.text or "⭐" not in msg.embeds[0].footer.text:
-                    print(msg.embeds)
-                    logger.info("No stars")
-                    continue
-
-                if msg.embeds[0].footer.text.endswith(str(payload.message_id)):
-                    logger.info("got one")
-                    found = True
-                    await msg.delete()
+    async def _sync_worker(
+            self, board: Board, starboard_channel: discord.TextChannel, channel: discord.TextChannel, message_id: int
+    ):
+        key = (board.name, message_id)
+        try:
+            while True:
+                await asyncio.sleep(self.delay)
+                self.dirty.discard(key)
+                starred = self.starred.get(key)
+                if starred is None:
+                    return
+                if starred.message is None:
+                    starred.message = await channel.fetch_message(message_id)
+                await self._sync_post(board, starboard_channel, starred.message, len(starred.reactors))
+                if key not in self.dirty:
+                    return
+        except Exception as e:
+            logger.error(f"Failed to update the {board.name} board message of {message_id}: {e}")
+        finally:
+            self.sync_tasks.pop(key, None)
+            self.dirty.discard(key)
+
+    async def _count_once(self, board: Board, channel: discord.TextChannel, message_id: int) -> StarredMessage:
+        """
+        Count the reactors of an uncached message once, events arriving meanwhile wait for the same count.
+        """
+        key = (board.name, message_id)
+        task = self.counting.get(key)
+        if task is None:
+            task = self.bot.loop.create_task(self._count_stars(board, channel, message_id))
+            self.counting[key] = task
+
+            def forget(done: asyncio.Task):
+                if self.counting.get(key) is done:
+                    del self.counting[key]
+
+            task.add_done_callback(forget)
+        return await asyncio.shield(task)
+
+    async def _count_stars(self, board: Board, channel: discord.TextChannel, message_id: int) -> StarredMessage:
+        message: discord.Message = await channel.fetch_message(message_id)
+        user_blacklist = self.user_blacklist.get(board.guild, ())
+        reactors = set()
+        for reaction in message.reactions:
+            if emoji_key(reaction.emoji) == board.key:
+                async for user in reaction.users():
+                    if user.id != message.author.id and str(user.id) not in user_blacklist:
+                        reactors.add(user.id)
+
+        starred = StarredMessage(message, reactors)
+        self.starred[(board.name, message_id)] = starred
+        if len(self.starred) > STAR_CACHE_SIZE:
+            self.starred.popitem(last=False)
+        return starred
+
+    async def _sync_post(
+            self, board: Board, starboard_channel: discord.TextChannel, message: discord.Message, count: int
+    ):
+        """
+        Create, update or delete the post of a message on `board` so that it matches `count`.
+        """
+        post_id = await self._get_post_id(board, message.id)
+        if (
+            post_id is None
+            and count >= board.stars
+            and board.name == DEFAULT_BOARD
+            and board.guild == self.legacy_posts_guild
+            and self.legacy_posts_before is not None
+            and message.created_at.replace(tzinfo=None) < self.legacy_posts_before
+        ):
+            post_id = await self._find_legacy_post(board, starboard_channel, message)
+
+        if post_id is not None:
+            post = starboard_channel.get_partial_message(post_id)
+            try:
+                if count < board.stars:
+                    logger.info("delete message")
+                    await post.delete()
+                    await self._set_post_id(board, message.id, None)
+                    return
+                await post.edit(content=message.channel.mention, embed=self._build_embed(board, message, count))
+                await self._set_post_id(board, message.id, post_id, message, count)
+                return
+            except discord.NotFound:
+                logger.info("Starboard message was deleted")
+                await self._set_post_id(board, message.id, None)
+
+        if count < board.stars:
+            return
+
+        post = await starboard_channel.send(message.channel.mention, embed=self._build_embed(board, message, count))
+        await self._set_post_id(board, message.id, post.id, message, count)
+
+    @staticmethod
+    def _build_embed(board: Board, message: discord.Message, count: int) -> discord.Embed:
+        embed = discord.Embed(
+            color=discord.Colour.gold(),
+            description=message.content,
+            timestamp=datetime.utcnow(),
+            title="Jump to message ►",
+            url=message.jump_url
+        )
+        embed.set_author(
+            name=str(message.author),
+            icon_url=message.author.avatar_url,
+        )
+        embed.set_footer(text=f"{board.label} {count} | {message.id}")
+        if message.attachments:
+            embed.set_image(url=message.attachments[0].url)
+        return embed
+
+    async def _get_post_id(self, board: Board, message_id: int) -> typing.Optional[int]:
+        key = (board.name, message_id)
+        if key in self.posts:
+            self.posts.move_to_end(key)
+            return self.posts[key]
+
+        mapping = await self.db.find_one({"source": message_id, "board": board.name}, {"post": 1})
+        post_id = mapping["post"] if mapping else None
+        self._cache_post_id(key, post_id)
+        return post_id
+
+    async def _set_post_id(
+            self,
+            board: Board,
+            message_id: int,
+            post_id: typing.Optional[int],
+            message: discord.Message = None,
+            count: int = None,
+    ):
+        """
+        Record the post of a message on `board`, along with its star count for the leaderboard.
+        """
+        self._cache_post_id((board.name, message_id), post_id)
+        leaderboard = self._leaderboard(board.guild, board.name)
+        if post_id is None:
+            leaderboard.remove(message_id)
+            await self.db.delete_one({"source": message_id, "board": board.name})
+            return
+
+        fields = {"post": post_id, "channel": message.channel.id, "guild": board.guild}
+        if count is not None:
+            created = message.created_at.replace(tzinfo=None)
+            fields.update(stars=count, author=message.author.id, created=created)
+            leaderboard.update(message_id, count, message.author.id, message.channel.id, created)
+        await self.db.update_one(
+            {"source": message_id, "board": board.name},
+            {"$set": fields},
+            upsert=True,
+        )
+
+    def _leaderboard(self, guild_id: int, name: str) -> Leaderboard:
+        if (guild_id, name) not in self.leaderboards:
+            self.leaderboards[(guild_id, name)] = Leaderboard()
+        return self.leaderboards[(guild_id, name)]
+
+    def _cache_post_id(self, key: typing.Tuple[str, int], post_id: typing.Optional[int]):
+        self.posts[key] = post_id
+        self.posts.move_to_end(key)
+        if len(self.posts) > POST_CACHE_SIZE:
+            self.posts.popitem(last=False)
+
+    async def _find_legacy_post(
+            self, board: Board, starboard_channel: discord.TextChannel, message: discord.Message
+    ) -> typing.Optional[int]:
+        """
+        Look for a post made before posts were tracked in the database, and start tracking it.
+        """
+        async for msg in starboard_channel.history(limit=70, around=message.created_at):
+            if not msg.embeds or not msg.embeds[0].footer or not msg.embeds[0].footer.text:
+                continue
+            footer = msg.embeds[0].footer.text
+            if footer.startswith("⭐") and footer.endswith(f"| {message.id}"):
+                await self._set_post_id(board, message.id, msg.id, message)
+                return msg.id
+        return None
 
 
 def setup(bot):
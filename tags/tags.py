@@ -1,14 +1,249 @@
+import asyncio
 import discord
-from datetime import datetime
+import gzip
+import json
+import tempfile
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 from discord.ext import commands
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from core import checks
-from core.models import PermissionLevel
+from core.models import PermissionLevel, getLogger
+from core.paginator import EmbedPaginatorSession
+
+logger = getLogger(__name__)
+
+# Buffered tag uses are written out when either of these is reached.
+USES_FLUSH_INTERVAL = 60
+USES_FLUSH_THRESHOLD = 100
+
+# Only the fields needed to use, edit or delete a tag are kept in memory.
+CACHE_PROJECTION = {"_id": 0, "name": 1, "content": 1, "author": 1}
+
+# Daily usage buckets are removed by MongoDB after this many days, `tags stats` can't look further back.
+USAGE_RETENTION_DAYS = 90
+
+# Characters of tag names on one page of `tags list`, the length of an embed description.
+TAGS_PAGE_LENGTH = 4096
+
+IMPORT_BATCH_SIZE = 500
+
+# Exports are split into gzipped files this far below the upload limit, for data still in the compressor.
+EXPORT_SIZE_MARGIN = 256 * 1024
+# Discord accepts at most this many attachments per message.
+EXPORT_MAX_FILES = 10
+
+
+class TagNameIndex:
+    """
+    Prefix trie and trigram index over tag names, used for autocomplete and "did you mean" suggestions.
+    """
+
+    def __init__(self):
+        self.trie: dict = dict()
+        self.grams: defaultdict = defaultdict(set)
+        self.gram_counts: dict = dict()
+
+    @staticmethod
+    def _grams(name: str) -> set:
+        padded = f"  {name.lower()} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, name: str):
+        node = self.trie
+        for char in name.lower():
+            node = node.setdefault(char, dict())
+        node.setdefault(None, set()).add(name)
+
+        grams = self._grams(name)
+        for gram in grams:
+            self.grams[gram].add(name)
+        self.gram_counts[name] = len(grams)
+
+    def remove(self, name: str):
+        path = []
+        node = self.trie
+        for char in name.lower():
+            if char not in node:
+                return
+            path.append((node, char))
+            node = node[char]
+
+        names = node.get(None)
+        if names is not None:
+            names.discard(name)
+            if not names:
+                del node[None]
+        for parent, char in reversed(path):
+            if parent[char]:
+                break
+            del parent[char]
+
+        for gram in self._grams(name):
+            postings = self.grams.get(gram)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self.grams[gram]
+        self.gram_counts.pop(name, None)
+
+    def complete(self, prefix: str, limit: int = 10) -> list:
+        """
+        Return up to `limit` names starting with `prefix` (case insensitive), in sorted order.
+        """
+        node = self.trie
+        for char in prefix.lower():
+            node = node.get(char)
+            if node is None:
+                return []
+
+        results = []
+        stack = [node]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            results.extend(sorted(node.get(None, ())))
+            stack.extend(node[char] for char in sorted((c for c in node if c is not None), reverse=True))
+        return results[:limit]
+
+    def suggest(self, name: str, limit: int = 3, cutoff: float = 0.3) -> list:
+        """
+        Return up to `limit` names most similar to `name` by trigram overlap.
+        """
+        grams = self._grams(name)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self.grams.get(gram, ()):
+                shared[candidate] += 1
+
+        scored = []
+        for candidate, count in shared.items():
+            score = count / (len(grams) + self.gram_counts[candidate] - count)
+            if score >= cutoff:
+                scored.append((score, candidate))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [candidate for _, candidate in scored[:limit]]
+
 
 class TagsPlugin(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot: commands.Bot = bot
         self.db = bot.plugin_db.get_partition(self)
+        self.tag_cache: dict = dict()
+        self.name_index = TagNameIndex()
+        self.cache_loaded = False
+        self.pending_uses: Counter = Counter()
+        self.pending_usage: Counter = Counter()
+        self.pending_total = 0
+        self.flush_lock = asyncio.Lock()
+        self.bot.loop.create_task(self._populate_cache())
+        self.flush_task = self.bot.loop.create_task(self._flush_uses_loop())
+
+    async def cog_unload(self):
+        # Cancelling the loop in the middle of a bulk write would drop the uses it had already taken
+        async with self.flush_lock:
+            self.flush_task.cancel()
+        await self._flush_uses()
+
+    async def _populate_cache(self):
+        """
+        Load every tag into memory once, so lookups never hit the database.
+        """
+        await self._ensure_indexes()
+        async for tag in self.db.find({"name": {"$type": "string"}}, CACHE_PROJECTION):
+            self.tag_cache[tag["name"]] = tag
+            self.name_index.add(tag["name"])
+        self.cache_loaded = True
+
+    async def _ensure_indexes(self):
+        await self.db.create_index([("type", 1), ("day", 1), ("tag", 1)])
+        await self.db.create_index(
+            "day",
+            expireAfterSeconds=USAGE_RETENTION_DAYS * 24 * 60 * 60,
+            partialFilterExpression={"type": "usage"},
+        )
+
+        duplicates = [
+            group["_id"]
+            async for group in self.db.aggregate(
+                [
+                    {"$match": {"name": {"$type": "string"}}},
+                    {"$group": {"_id": "$name", "count": {"$sum": 1}}},
+                    {"$match": {"count": {"$gt": 1}}},
+                ]
+            )
+        ]
+        if duplicates:
+            logger.warning(
+                f"Not creating a unique index on tag names, duplicates found: {', '.join(duplicates)}"
+            )
+            return
+
+        await self.db.create_index(
+            "name",
+            unique=True,
+            partialFilterExpression={"name": {"$type": "string"}},
+        )
+
+    async def _flush_uses_loop(self):
+        while True:
+            await asyncio.sleep(USES_FLUSH_INTERVAL)
+            await self._flush_uses()
+
+    async def _flush_uses(self):
+        """
+        Write all buffered tag uses to the database as a single bulk `$inc`.
+
+        Each use also goes into a daily usage bucket (`{"type": "usage", "tag", "day", "count"}`), which `tags stats` reads.
+        """
+        async with self.flush_lock:
+            if not self.pending_uses and not self.pending_usage:
+                return
+            pending, self.pending_uses = self.pending_uses, Counter()
+            usage, self.pending_usage = self.pending_usage, Counter()
+            self.pending_total = 0
+            # (counter, key, count) of every operation, by position, to put back the ones that failed
+            deltas = [(self.pending_uses, name, count) for name, count in pending.items()]
+            deltas.extend((self.pending_usage, key, count) for key, count in usage.items())
+            operations = [
+                UpdateOne({"name": name}, {"$inc": {"uses": count}})
+                for name, count in pending.items()
+            ]
+            operations.extend(
+                UpdateOne(
+                    {"type": "usage", "day": day, "tag": name},
+                    {"$inc": {"count": count}},
+                    upsert=True,
+                )
+                for (name, day), count in usage.items()
+            )
+            try:
+                await self.db.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # The other operations of an unordered bulk write went through
+                failed = [deltas[error["index"]] for error in e.details.get("writeErrors", [])]
+                logger.error(f"Failed to flush {len(failed)} of {len(operations)} tag use updates: {e}")
+                self._restore_uses(failed)
+            except Exception as e:
+                logger.error(f"Failed to flush tag uses: {e}")
+                self._restore_uses(deltas)
+
+    def _restore_uses(self, deltas: list):
+        for counter, key, count in deltas:
+            counter[key] += count
+            if counter is self.pending_uses:
+                self.pending_total += count
+
+    def _record_use(self, tag: dict):
+        self.pending_uses[tag["name"]] += 1
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.pending_usage[(tag["name"], today)] += 1
+        self.pending_total += 1
+        if self.pending_total >= USES_FLUSH_THRESHOLD:
+            self.bot.loop.create_task(self._flush_uses())
 
     @commands.group(invoke_without_command=True)
     @commands.guild_only()
@@ -27,16 +262,22 @@ class TagsPlugin(commands.Cog):
         if await self.find_db(name=name) is not None:
             await ctx.send(f"❌ | A tag with the name `{name}` already exists.")
         else:
-            await self.db.insert_one(
-                {
-                    "name": name,
-                    "content": content,
-                    "createdAt": datetime.utcnow(),
-                    "updatedAt": datetime.utcnow(),
-                    "author": ctx.author.id,
-                    "uses": 0,
-                }
-            )
+            try:
+                await self.db.insert_one(
+                    {
+                        "name": name,
+                        "content": content,
+                        "createdAt": datetime.utcnow(),
+                        "updatedAt": datetime.utcnow(),
+                        "author": ctx.author.id,
+                        "uses": 0,
+                    }
+                )
+            except DuplicateKeyError:
+                await ctx.send(f"❌ | A tag with the name `{name}` already exists.")
+                return
+            self.tag_cache[name] = {"name": name, "content": content, "author": ctx.author.id}
+            self.name_index.add(name)
             await ctx.send(f"✅ | Tag `{name}` has been successfully created!")
 
     @tags.command()
@@ -48,13 +289,14 @@ class TagsPlugin(commands.Cog):
         """
         tag = await self.find_db(name=name)
         if tag is None:
-            await ctx.send(f"❌ | The tag `{name}` does not exist.")
+            await self._send_not_found(ctx, name)
         else:
             if ctx.author.id == tag["author"] or ctx.author.guild_permissions.manage_guild:
-                await self.db.find_one_and_update(
+                await self.db.update_one(
                     {"name": name},
                     {"$set": {"content": content, "updatedAt": datetime.utcnow()}},
                 )
+                tag["content"] = content
                 await ctx.send(f"✅ | Tag `{name}` has been successfully updated.")
             else:
                 await ctx.send("❌ | You do not have permission to edit this tag.")
@@ -68,10 +310,13 @@ class TagsPlugin(commands.Cog):
         """
         tag = await self.find_db(name=name)
         if tag is None:
-            await ctx.send(f"❌ | The tag `{name}` does not exist.")
+            await self._send_not_found(ctx, name)
         else:
             if ctx.author.id == tag["author"] or ctx.author.guild_permissions.manage_guild:
                 await self.db.delete_one({"name": name})
+                await self.db.delete_many({"type": "usage", "tag": name})
+                self.tag_cache.pop(name, None)
+                self.name_index.remove(name)
                 await ctx.send(f"✅ | Tag `{name}` has been successfully deleted.")
             else:
                 await ctx.send("❌ | You do not have permission to delete this tag.")
@@ -81,9 +326,9 @@ class TagsPlugin(commands.Cog):
         """
         Get detailed information about a tag
         """
-        tag = await self.find_db(name=name)
+        tag = await self.find_db(name=name, projection={"_id": 0, "content": 0})
         if tag is None:
-            await ctx.send(f"❌ | The tag `{name}` does not exist.")
+            await self._send_not_found(ctx, name)
         else:
             user: discord.User = await self.bot.fetch_user(tag["author"])
             embed = discord.Embed(
@@ -93,7 +338,7 @@ class TagsPlugin(commands.Cog):
             embed.add_field(name="Created By", value=f"{user}")
             embed.add_field(name="Created At", value=tag["createdAt"])
             embed.add_field(name="Last Modified", value=tag["updatedAt"], inline=False)
-            embed.add_field(name="Uses", value=tag["uses"], inline=False)
+            embed.add_field(name="Uses", value=tag["uses"] + self.pending_uses[name], inline=False)
             await ctx.send(embed=embed)
 
     @tags.command()
@@ -101,14 +346,187 @@ class TagsPlugin(commands.Cog):
         """
         List all available tags
         """
-        tags_cursor = self.db.find({})
-        tags = await tags_cursor.to_list(length=100)
+        embeds = []
+        for page in await self._tag_name_pages():
+            embed = discord.Embed(
+                title="📋 | Available tags",
+                description=page,
+                color=self.bot.main_color,
+            )
+            embeds.append(embed)
 
-        if not tags:
+        if not embeds:
             await ctx.send("❌ | No tags are available.")
         else:
-            tag_list = ", ".join([tag["name"] for tag in tags])
-            await ctx.send(f"📋 | Available tags: {tag_list}")
+            paginator = EmbedPaginatorSession(ctx, *embeds)
+            await paginator.run()
+
+    @tags.command()
+    async def search(self, ctx: commands.Context, prefix: str):
+        """
+        Find tags whose name starts with the given text
+        """
+        names = self.name_index.complete(prefix, limit=25)
+        if not names:
+            await ctx.send(f"❌ | No tags start with `{prefix}`.")
+        else:
+            await ctx.send(f"🔍 | Matching tags: {', '.join(f'`{name}`' for name in names)}")
+
+    @tags.command()
+    async def stats(self, ctx: commands.Context, days: int = 7, limit: int = 10):
+        """
+        Show the most used tags over the last few days
+
+        **Usage:**
+        {prefix}tags stats [days] [limit]
+        """
+        if not 0 < days <= USAGE_RETENTION_DAYS or not 0 < limit <= 25:
+            await ctx.send(
+                f"❌ | Days must be between 1 and {USAGE_RETENTION_DAYS} and the limit between 1 and 25."
+            )
+            return
+
+        await self._flush_uses()
+        since = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+        top = [
+            bucket
+            async for bucket in self.db.aggregate(
+                [
+                    {"$match": {"type": "usage", "day": {"$gte": since}}},
+                    {"$group": {"_id": "$tag", "count": {"$sum": "$count"}}},
+                    {"$sort": {"count": -1, "_id": 1}},
+                    {"$limit": limit},
+                ]
+            )
+        ]
+
+        if not top:
+            await ctx.send(f"❌ | No tags were used in the last {days} days.")
+            return
+
+        embed = discord.Embed(
+            title=f"📈 | Top tags in the last {days} days",
+            description="\n".join(
+                f"**{index}.** `{bucket['_id']}` - {bucket['count']} uses"
+                for index, bucket in enumerate(top, start=1)
+            ),
+            color=self.bot.main_color,
+        )
+        await ctx.send(embed=embed)
+
+    @tags.command()
+    async def export(self, ctx: commands.Context, fmt: str = "ndjson"):
+        """
+        Export all tags as gzipped `ndjson` (default) or `json` files
+
+        Large exports are split into several files, each below the server's upload limit.
+        """
+        fmt = fmt.lower()
+        if fmt not in ("ndjson", "json"):
+            await ctx.send("❌ | The export format must be either `ndjson` or `json`.")
+            return
+
+        await self._flush_uses()
+        limit = (ctx.guild.filesize_limit if ctx.guild else 8 * 1024 * 1024) - EXPORT_SIZE_MARGIN
+        count = 0
+        parts = []
+        try:
+            part = self._open_export_part(parts, fmt)
+            written = 0
+            async for tag in self.db.find({"name": {"$type": "string"}}, {"_id": 0}):
+                line = json.dumps(tag, default=self._encode_value).encode()
+                if written and part.fileobj.tell() + len(line) >= limit:
+                    self._close_export_part(part, fmt)
+                    if len(parts) == EXPORT_MAX_FILES:
+                        await ctx.send(
+                            f"❌ | The export doesn't fit in {EXPORT_MAX_FILES} files of "
+                            f"{limit // (1024 * 1024)} MB, even compressed."
+                        )
+                        return
+                    part = self._open_export_part(parts, fmt)
+                    written = 0
+                if fmt == "json" and written:
+                    part.write(b",\n")
+                part.write(line)
+                if fmt == "ndjson":
+                    part.write(b"\n")
+                written += 1
+                count += 1
+            self._close_export_part(part, fmt)
+
+            files = []
+            for index, fp in enumerate(parts, start=1):
+                fp.seek(0)
+                suffix = f"-{index}" if len(parts) > 1 else ""
+                files.append(discord.File(fp, filename=f"tags{suffix}.{fmt}.gz"))
+            try:
+                await ctx.send(f"✅ | Exported {count} tags.", files=files)
+            except discord.HTTPException as e:
+                await ctx.send(f"❌ | Failed to upload the export: {e}")
+        finally:
+            for fp in parts:
+                fp.close()
+
+    @staticmethod
+    def _open_export_part(parts: list, fmt: str) -> gzip.GzipFile:
+        fp = tempfile.TemporaryFile()
+        parts.append(fp)
+        part = gzip.GzipFile(fileobj=fp, mode="wb")
+        if fmt == "json":
+            part.write(b"[\n")
+        return part
+
+    @staticmethod
+    def _close_export_part(part: gzip.GzipFile, fmt: str):
+        if fmt == "json":
+            part.write(b"\n]\n")
+        part.close()
+
+    @tags.command(name="import")
+    async def import_(self, ctx: commands.Context, mode: str = "skip"):
+        """
+        Import tags from attached export files
+
+        Files are read line by line, so they have to be `ndjson` exports or `json` exports with one tag per line.
+        Gzipped (`.gz`) files and every part of a split export can be attached at once.
+        `mode` decides what happens to tags that already exist: `skip` (default) keeps them, `overwrite` replaces them.
+        """
+        mode = mode.lower()
+        if mode not in ("skip", "overwrite"):
+            await ctx.send("❌ | The import mode must be either `skip` or `overwrite`.")
+            return
+        if not ctx.message.attachments:
+            await ctx.send("❌ | Attach an exported tags file to import.")
+            return
+
+        started = time.perf_counter()
+        stats = Counter()
+        batch = dict()
+        for attachment in ctx.message.attachments:
+            async with self.bot.session.get(attachment.url) as resp:
+                async for line in self._iter_lines(resp, attachment.filename.endswith(".gz")):
+                    line = line.strip().rstrip(b",")
+                    if line in (b"", b"[", b"]"):
+                        continue
+                    try:
+                        tag = self._decode_tag(json.loads(line), ctx.author.id)
+                    except (ValueError, TypeError, KeyError):
+                        stats["invalid"] += 1
+                        continue
+                    batch[tag["name"]] = tag
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        stats.update(await self._import_batch(list(batch.values()), mode == "overwrite"))
+                        batch = dict()
+        if batch:
+            stats.update(await self._import_batch(list(batch.values()), mode == "overwrite"))
+
+        elapsed = time.perf_counter() - started
+        total = stats["created"] + stats["replaced"] + stats["skipped"]
+        await ctx.send(
+            f"✅ | Imported {stats['created']} new tags, replaced {stats['replaced']}, "
+            f"skipped {stats['skipped']} existing and {stats['invalid']} invalid "
+            f"in {elapsed:.2f}s ({total / elapsed if elapsed else total:.0f} tags/s)."
+        )
 
     @commands.command()
     async def tag(self, ctx: commands.Context, name: str):
@@ -117,12 +535,10 @@ class TagsPlugin(commands.Cog):
         """
         tag = await self.find_db(name=name)
         if tag is None:
-            await ctx.send(f"❌ | The tag `{name}` does not exist.")
+            await self._send_not_found(ctx, name)
         else:
             await ctx.send(tag["content"])
-            await self.db.find_one_and_update(
-                {"name": name}, {"$set": {"uses": tag["uses"] + 1}}
-            )
+            self._record_use(tag)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
@@ -130,16 +546,126 @@ class TagsPlugin(commands.Cog):
             return
 
         content = message.content[len(self.bot.command_prefix):].split(" ", 1)
-        tag = await self.db.find_one({"name": content[0]})
+        tag = await self.find_db(name=content[0])
 
         if tag:
             await message.channel.send(tag["content"])
-            await self.db.find_one_and_update(
-                {"name": content[0]}, {"$set": {"uses": tag["uses"] + 1}}
-            )
+            self._record_use(tag)
+
+    @staticmethod
+    async def _iter_lines(resp, gzipped: bool):
+        """
+        Yield the lines of a download as they arrive, decompressing gzipped files on the fly.
+        """
+        if not gzipped:
+            async for line in resp.content:
+                yield line
+            return
+
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        buffer = b""
+        async for chunk in resp.content.iter_chunked(64 * 1024):
+            buffer += decompressor.decompress(chunk)
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line
+        buffer += decompressor.flush()
+        for line in buffer.split(b"\n"):
+            yield line
+
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+    @staticmethod
+    def _decode_tag(data: dict, default_author: int) -> dict:
+        name = data["name"]
+        content = data["content"]
+        if not isinstance(name, str) or not name or " " in name or not isinstance(content, str):
+            raise ValueError("Invalid tag")
+
+        now = datetime.utcnow()
+        created_at = data.get("createdAt")
+        updated_at = data.get("updatedAt")
+        return {
+            "name": name,
+            "content": content,
+            "createdAt": datetime.fromisoformat(created_at) if created_at else now,
+            "updatedAt": datetime.fromisoformat(updated_at) if updated_at else now,
+            "author": int(data.get("author", default_author)),
+            "uses": int(data.get("uses", 0)),
+        }
+
+    async def _import_batch(self, tags: list, overwrite: bool) -> Counter:
+        """
+        Upsert one batch of tags and bring the in-memory indexes in line with what was written.
+        """
+        if overwrite:
+            operations = [ReplaceOne({"name": tag["name"]}, tag, upsert=True) for tag in tags]
+        else:
+            operations = [
+                UpdateOne({"name": tag["name"]}, {"$setOnInsert": tag}, upsert=True)
+                for tag in tags
+            ]
+
+        try:
+            result = (await self.db.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            # Conflicting concurrent inserts are reported per operation; the rest of the batch is still written.
+            result = e.details
+            logger.warning(f"{len(result['writeErrors'])} tags failed to import")
+
+        upserted = {item["index"] for item in result["upserted"]}
+        failed = {item["index"] for item in result["writeErrors"]}
+        stats = Counter(created=len(upserted))
+        if overwrite:
+            stats["replaced"] = result["nMatched"]
+        else:
+            stats["skipped"] = result["nMatched"] + len(failed)
+
+        for index, tag in enumerate(tags):
+            if index in failed or (not overwrite and index not in upserted):
+                continue
+            self.tag_cache[tag["name"]] = {key: tag[key] for key in ("name", "content", "author")}
+            self.name_index.add(tag["name"])
+        return stats
+
+    async def _send_not_found(self, ctx: commands.Context, name: str):
+        message = f"❌ | The tag `{name}` does not exist."
+        suggestions = self.name_index.suggest(name)
+        if suggestions:
+            message += f" Did you mean: {', '.join(f'`{suggestion}`' for suggestion in suggestions)}?"
+        await ctx.send(message)
+
+    async def _tag_name_pages(self, page_length: int = TAGS_PAGE_LENGTH) -> list:
+        """
+        Join the sorted tag names into pages of at most `page_length` characters, without cutting any name.
+
+        The names are taken from the cache once it is loaded.
+        """
+        if self.cache_loaded:
+            names = sorted(self.tag_cache)
+        else:
+            cursor = self.db.find({"name": {"$type": "string"}}, {"_id": 0, "name": 1}).sort("name", 1)
+            names = [tag["name"] async for tag in cursor]
+        pages = []
+        page = ""
+        for name in names:
+            entry = f"`{name}`"
+            if page and len(page) + len(", ") + len(entry) > page_length:
+                pages.append(page)
+                page = ""
+            page = f"{page}, {entry}" if page else entry
+        if page:
+            pages.append(page)
+        return pages
 
-    async def find_db(self, name: str):
-        return await self.db.find_one({"name": name})
+    async def find_db(self, name: str, projection: dict = CACHE_PROJECTION):
+        if self.cache_loaded and projection is CACHE_PROJECTION:
+            return self.tag_cache.get(name)
+        return await self.db.find_one({"name": name}, projection)
 
 
 async def setup(bot: commands.Bot):